@@ -0,0 +1,16 @@
+#导入PDF后运行此段代码，对比向量、词法和融合三种检索模式的召回率与耗时
+import json
+import sys
+from app.rag.rag import RagManager
+from app.models.model import get_qwen_models
+
+llm, chat, embed = get_qwen_models()
+cases_path = sys.argv[1] if len(sys.argv) > 1 else "data/retrieval_eval.json"
+
+# 评估用例：[查询, 期望出现在检索结果中的关键词]
+with open(cases_path, 'r', encoding='utf-8') as f:
+    cases = json.load(f)
+
+rag = RagManager(host="localhost", port=8000, llm=llm, embed=embed)
+report = rag.evaluate(cases)
+print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -1,7 +1,8 @@
 import json
 from typing import List
 from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from langserve import add_routes
@@ -11,71 +12,137 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.runnables import RunnablePassthrough
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_chroma import Chroma
 from langchain.chains import create_history_aware_retriever
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
-import pinyin
 from langchain_community.embeddings import DashScopeEmbeddings
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 import asyncio
 from app.rag.rag import RagManager
+from app.rag.pdf_processor import PDFProcessor
+from app.rag.collection_registry import active_collection, new_collection_name, remove_collection_files
+from app.services.ingest_jobs import IngestionJobManager
+from app.services.pdf_uploads import PDFUploadStore
 from app.models.model import get_qwen_models
 from datetime import datetime, timedelta
-from langchain_core.tools import tool
+from langchain_core.tools import tool, StructuredTool
 from duckduckgo_search import DDGS
-import requests
-import pandas as pd
 from langchain.agents import AgentExecutor, create_openai_tools_agent
+from app.agents.executor import ConcurrentAgentExecutor
+from app.agents.context import RuntimeContextBuilder, current_time_text, detect_time_sensitive
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import MessagesPlaceholder
 import mysql.connector
 import bcrypt
 import jwt
 import os
-import subprocess
-import sys
 from functools import wraps
 from mysql.connector import Error
 
 #######################获取模型##########################
 llm, chat, embed = get_qwen_models()
 ######################加载城市ID数据#####################
-import pandas as pd
-import chardet
-
-# 读取文件的二进制内容
-city_df = pd.read_csv('China-City-List-latest.csv', encoding='gbk')
-print(city_df.head())
+from app.services.gazetteer import CityGazetteer
+# 启动时一次性构建城市索引，请求路径上不再扫描DataFrame
+city_gazetteer = CityGazetteer('China-City-List-latest.csv', encoding='gbk')
+
+# 语义答案缓存（可选）：相似的首轮非时效性问题直接复用历史回答
+from app.services.answer_cache import SemanticAnswerCache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+# 缓存在每个worker进程内各自保存，以当前生效的知识库集合为版本，任一worker重建知识库后所有worker的缓存都会失效
+# 以问题中的目的地为作用域，不同城市的相似问题不会互相命中
+answer_cache = SemanticAnswerCache(embed, threshold=0.92, max_entries=500, ttl=24 * 3600,
+                                   generation=lambda: active_collection(KB_PERSIST_PATH),
+                                   scope=lambda question: region_matcher.match(question)[0]) \
+    if ANSWER_CACHE_ENABLED else None
 
 #####################导入需要的数据######################
 from data import locations, province_dict
-store = {}  # 存储聊天消息历史记录的对象，key为session_id，value为消息历史记录的对象
+from app.services.region_matcher import RegionMatcher
+# 本地目的地识别：由地点列表、省份字典、城市CSV和别名规则构建的多模式匹配自动机
+region_matcher = RegionMatcher(locations, province_dict, city_gazetteer.records)
+from app.services.catalog import AttractionCatalog
+attraction_catalog = AttractionCatalog('all.json')  # 景点目录，启动时加载，文件变化时自动重载
+from app.services.nmc import build_nmc_url_table, load_overrides
+nmc_url_table = build_nmc_url_table(province_dict, load_overrides())  # 城市 -> NMC天气预报URL
+from app.services.weather_cache import WeatherCache
+weather_cache = WeatherCache(default_ttl=1800, stale_ttl=3600)  # 天气数据缓存（按数据源+城市）
+NMC_TTL = 3600  # 中央气象台7天预报缓存时间（秒）
+from app.services.session_store import SessionStore
+from app.services.sqlite_history import SQLiteSessionStore
+# 会话存储后端：sqlite 持久化且可在多个worker进程间共享；memory 为进程内有界存储
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+if SESSION_BACKEND == "sqlite":
+    store = SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), max_messages=50)
+else:
+    # 存储聊天消息历史记录的对象，按session_id管理，超出容量按LRU淘汰，空闲超时自动清理
+    store = SessionStore(max_sessions=1000, idle_ttl=3600, max_messages=50)
 ####################导入自定义函数#######################
-from function import fetch_weather_data, load_and_split
-# 管理会话历史记录，获取会话ID（session_id）所对应的 ChatMessageHistory对象，不存在就创建一个，并将其存储在一个全局字典 store 中，以便后续检索和使用。
+from function import fetch_weather_data, afetch_weather_data, load_and_split
+from app.services import http_client
+# 管理会话历史记录，获取会话ID（session_id）所对应的 ChatMessageHistory对象，不存在就创建一个，并将其存储在有界会话存储 store 中，以便后续检索和使用。
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        # ChatMessageHistory(): 一个用于存储聊天消息历史记录的对象，通常包含用户和 AI 的交互记录。
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
 
 
 # 创建向量存储数据库管理对象
 rag = RagManager(host="localhost", port=8000, llm=llm, embed=embed)
 retriever = rag.retriever
 
+# 知识库重建：PDF目录和向量库目录（相对于 Agent_backend）
+KB_PDF_DIRECTORY = "app/dataset/pdf"
+KB_PERSIST_PATH = "chroma_db"
+
+
+def build_knowledge_base(job):
+    """
+    后台任务：在新集合中重建知识库，成功后原子切换 RagManager 的检索器
+    新集合先从当前生效的集合复制未变化文件的文本块和向量，只解析和向量化新增或变化的文件
+    """
+    source = active_collection(KB_PERSIST_PATH)
+    collection = new_collection_name(avoid={source})
+    processor = PDFProcessor(directory=KB_PDF_DIRECTORY,
+                             chroma_server_type="local",
+                             persist_path=KB_PERSIST_PATH,
+                             embed=embed,
+                             # 在服务进程内默认逐个解析，避免 spawn 方式的子进程重新导入本模块
+                             parse_workers=int(os.getenv("PDF_PARSE_WORKERS", "1")),
+                             collection_name=collection)
+    job.progress = processor.progress
+    try:
+        processor.seed_from(source)
+        processor.process_pdfs()
+    except Exception:
+        # 构建失败的集合不会被使用，直接删除
+        processor.chroma_db.delete_collection(collection)
+        remove_collection_files(KB_PERSIST_PATH, collection)
+        raise
+
+    previous = rag.switch_collection(collection)
+    # 知识库内容已变化，清空语义答案缓存
+    if answer_cache is not None:
+        answer_cache.invalidate()
+    return {"collection": collection, "previous_collection": previous,
+            "files": processor.progress["files_done"], "chunks": processor.progress["chunks"]}
+
+
+# 任务状态保存在向量库目录下的SQLite中，多个 worker 进程共享，同一时间只有一个重建任务
+os.makedirs(KB_PERSIST_PATH, exist_ok=True)
+ingestion_jobs = IngestionJobManager(build_knowledge_base, db_path=os.path.join(KB_PERSIST_PATH, "ingest_jobs.db"))
+# 上传的PDF保存在知识库目录中
+pdf_uploads = PDFUploadStore(KB_PDF_DIRECTORY)
+
 
 ######################创建Agent####################
 # 定义工具函数
 @tool
 def get_time() -> str:
     """获取当前时间，包括年月日和时间，可用于判断当前月份和季节"""
-    now = datetime.now()
-    formatted_time = now.strftime("当前时间是：%Y年%m月%d日 %H:%M")
-    return formatted_time
+    return current_time_text()
 
 # 定义时效性检测工具
 @tool
@@ -85,31 +152,51 @@ def is_time_sensitive_query(query: str) -> str:
     :param query: 用户输入的查询文本
     :return: 字符串 '是' 表示需要实时搜索，'否' 表示优先知识库检索
     """
-    import re
-    # 定义时效性关键词列表
-    time_keywords = ["最近", "最新", "近期", "近来", "刚刚", "刚", "即将", "现在",
-                     "本月", "本周", "今年", "明年", "明天", "当前", "正在进行", "刚结束"]
-    # 定义事件相关词
-    event_keywords = ["活动", "展览", "演出", "赛事", "比赛", "促销", "优惠", "打折", "节日",
-                      "庆典", "开幕", "开业", "上新", "首发"]
-    q = query.lower()
-    # 匹配时间关键词
-    for kw in time_keywords:
-        if kw in q:
-            return "是"
-    # 匹配事件关键词
-    for kw in event_keywords:
-        if kw in q:
-            return "是"
-    # 匹配日期或年份模式，如 '2025年6月15日'
-    if re.search(r"\d{4}年|\d{1,2}月\d{1,2}日", q):
-        return "是"
-    return "否"
+    return "是" if detect_time_sensitive(query) else "否"
 
 # 高德地图API Key
 AMAP_KEY = "你的高德地图API Key"
+
+def async_tool(coroutine):
+    """将同步工具函数与其异步版本合并为一个工具，智能体 ainvoke 时直接 await 异步版本，不占用线程"""
+    def decorator(func):
+        return StructuredTool.from_function(func=func, coroutine=coroutine)
+    return decorator
+
+def _nearby_pois_url(location, keyword, radius, city):
+    url = f"https://restapi.amap.com/v5/place/around?key={AMAP_KEY}&keywords={keyword}&location={location}&radius={radius}"
+    if city:
+        url += f"&city={city}"
+    return url
+
+def _format_nearby_pois(response, keyword):
+    if response.status_code == 200:
+        data = response.json()
+        if data['status'] == '1' and data['count'] != '0':
+            pois = data['pois']
+            result = []
+            for i, poi in enumerate(pois[:10], 1):  # 限制返回10个POI
+                name = poi.get('name', '未知')
+                address = poi.get('address', '未知地址')
+                distance = poi.get('distance', '未知')
+                type_code = poi.get('type', '未知类型')
+                result.append(f"{i}. {name}\n   地址: {address}\n   距离: {distance}米\n   类型: {type_code}")
+
+            return f"在指定位置附近找到{len(pois)}个\"{keyword}\":\n\n" + "\n\n".join(result)
+        else:
+            return f"未找到附近的\"{keyword}\"，状态码: {data['status']}, 错误信息: {data.get('info', '未知错误')}"
+    else:
+        return f"API请求失败: {response.status_code}, 响应内容: {response.text}"
+
+async def _asearch_nearby_pois(location: str, keyword: str, radius: int = 1000, city: str = None) -> str:
+    try:
+        response = await http_client.aget(_nearby_pois_url(location, keyword, radius, city))
+        return _format_nearby_pois(response, keyword)
+    except Exception as e:
+        return f"查询附近兴趣点时发生错误: {str(e)}"
+
 # 高德地图附近POI查询工具
-@tool
+@async_tool(_asearch_nearby_pois)
 def search_nearby_pois(location: str, keyword: str, radius: int = 1000, city: str = None) -> str:
     """
     使用高德地图API查询附近的兴趣点（POIs）
@@ -120,33 +207,68 @@ def search_nearby_pois(location: str, keyword: str, radius: int = 1000, city: st
     :return: 附近POI信息的文本描述
     """
     try:
-        url = f"https://restapi.amap.com/v5/place/around?key={AMAP_KEY}&keywords={keyword}&location={location}&radius={radius}"
-        if city:
-            url += f"&city={city}"
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == '1' and data['count'] != '0':
-                pois = data['pois']
-                result = []
-                for i, poi in enumerate(pois[:10], 1):  # 限制返回10个POI
-                    name = poi.get('name', '未知')
-                    address = poi.get('address', '未知地址')
-                    distance = poi.get('distance', '未知')
-                    type_code = poi.get('type', '未知类型')
-                    result.append(f"{i}. {name}\n   地址: {address}\n   距离: {distance}米\n   类型: {type_code}")
-                
-                return f"在指定位置附近找到{len(pois)}个\"{keyword}\":\n\n" + "\n\n".join(result)
-            else:
-                return f"未找到附近的\"{keyword}\"，状态码: {data['status']}, 错误信息: {data.get('info', '未知错误')}"
-        else:
-            return f"API请求失败: {response.status_code}, 响应内容: {response.text}"
+        response = http_client.get(_nearby_pois_url(location, keyword, radius, city))
+        return _format_nearby_pois(response, keyword)
     except Exception as e:
         return f"查询附近兴趣点时发生错误: {str(e)}"
 
+def _travel_route_url(origin, destination, waypoints):
+    # 为驾车路线规划添加 strategy=10 参数，以获取更稳定和接近App推荐的路线
+    url = f"https://restapi.amap.com/v3/direction/driving?key={AMAP_KEY}&origin={origin}&destination={destination}&strategy=10"
+    if waypoints:
+        url += f"&waypoints={waypoints}"
+    return url
+
+def _format_travel_route(response):
+    if response.status_code == 200:
+        data = response.json()
+        if data['status'] == '1' and data.get('route', {}).get('paths'):
+            paths = data['route']['paths'][0]  # 获取第一条推荐路径
+            distance = paths.get('distance', '0')  # 路径距离，单位：米
+            duration = paths.get('duration', '0')  # 预计耗时，单位：秒
+            tolls = paths.get('tolls', '0')  # 道路收费，单位：元
+            toll_distance = paths.get('toll_distance', '0')  # 收费路段长度，单位：米
+
+            # 计算小时和分钟
+            duration_hours = int(duration) // 3600
+            duration_minutes = (int(duration) % 3600) // 60
+            time_str = ""
+            if duration_hours > 0:
+                time_str += f"{duration_hours}小时"
+            if duration_minutes > 0:
+                time_str += f"{duration_minutes}分钟"
+
+            # 获取路径详情
+            steps = []
+            for i, step in enumerate(paths.get('steps', []), 1):
+                instruction = step.get('instruction', '').replace('<[^>]+>', '')  # 去除HTML标签
+                road_name = step.get('road_name', '未知道路')
+                step_distance = step.get('distance', '0')
+                steps.append(f"{i}. {instruction} - {road_name} ({step_distance}米)")
+
+            result = f"路线规划结果:\n"
+            result += f"总距离: {float(distance)/1000:.1f}公里\n"
+            result += f"预计耗时: {time_str}\n"
+            if int(tolls) > 0:
+                result += f"道路收费: {tolls}元 (收费路段: {float(toll_distance)/1000:.1f}公里)\n"
+            result += "\n详细路线:\n"
+            result += "\n".join(steps)
+
+            return result
+        else:
+            return f"路径规划失败: 状态码: {data['status']}, 错误信息: {data.get('info', '未知错误')}"
+    else:
+        return f"API请求失败: {response.status_code}, 响应内容: {response.text}"
+
+async def _aplan_travel_route(origin: str, destination: str, waypoints: str = None) -> str:
+    try:
+        response = await http_client.aget(_travel_route_url(origin, destination, waypoints))
+        return _format_travel_route(response)
+    except Exception as e:
+        return f"规划旅游路线时发生错误: {str(e)}"
+
 # 高德地图路径规划工具
-@tool
+@async_tool(_aplan_travel_route)
 def plan_travel_route(origin: str, destination: str, waypoints: str = None) -> str:
     """
     使用高德地图API规划旅游路线
@@ -156,56 +278,68 @@ def plan_travel_route(origin: str, destination: str, waypoints: str = None) -> s
     :return: 路径规划结果的文本描述
     """
     try:
-        # 为驾车路线规划添加 strategy=10 参数，以获取更稳定和接近App推荐的路线
-        url = f"https://restapi.amap.com/v3/direction/driving?key={AMAP_KEY}&origin={origin}&destination={destination}&strategy=10"
-        if waypoints:
-            url += f"&waypoints={waypoints}"
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == '1' and data.get('route', {}).get('paths'):
-                paths = data['route']['paths'][0]  # 获取第一条推荐路径
-                distance = paths.get('distance', '0')  # 路径距离，单位：米
-                duration = paths.get('duration', '0')  # 预计耗时，单位：秒
-                tolls = paths.get('tolls', '0')  # 道路收费，单位：元
-                toll_distance = paths.get('toll_distance', '0')  # 收费路段长度，单位：米
-                
-                # 计算小时和分钟
-                duration_hours = int(duration) // 3600
-                duration_minutes = (int(duration) % 3600) // 60
-                time_str = ""
-                if duration_hours > 0:
-                    time_str += f"{duration_hours}小时"
-                if duration_minutes > 0:
-                    time_str += f"{duration_minutes}分钟"
-                
-                # 获取路径详情
-                steps = []
-                for i, step in enumerate(paths.get('steps', []), 1):
-                    instruction = step.get('instruction', '').replace('<[^>]+>', '')  # 去除HTML标签
-                    road_name = step.get('road_name', '未知道路')
-                    step_distance = step.get('distance', '0')
-                    steps.append(f"{i}. {instruction} - {road_name} ({step_distance}米)")
-                
-                result = f"路线规划结果:\n"
-                result += f"总距离: {float(distance)/1000:.1f}公里\n"
-                result += f"预计耗时: {time_str}\n"
-                if int(tolls) > 0:
-                    result += f"道路收费: {tolls}元 (收费路段: {float(toll_distance)/1000:.1f}公里)\n"
-                result += "\n详细路线:\n"
-                result += "\n".join(steps)  
-                
-                return result
-            else:
-                return f"路径规划失败: 状态码: {data['status']}, 错误信息: {data.get('info', '未知错误')}"
-        else:
-            return f"API请求失败: {response.status_code}, 响应内容: {response.text}"
+        response = http_client.get(_travel_route_url(origin, destination, waypoints))
+        return _format_travel_route(response)
     except Exception as e:
         return f"规划旅游路线时发生错误: {str(e)}"
 
+def _cycling_route_url(origin, destination):
+    # 使用V4版本的骑行路径规划API
+    return f"https://restapi.amap.com/v4/direction/bicycling?key={AMAP_KEY}&origin={origin}&destination={destination}"
+
+def _format_cycling_route(response):
+    if response.status_code == 200:
+        data = response.json()
+        # V4 API的成功状态码通常是0 (errcode) 并且有data字段
+        if data.get('errcode') == 0 and data.get('data') and data['data'].get('paths'):
+            # V4 API的路径信息在 data['paths'] 下，通常只有一个path
+            path_data = data['data']['paths'][0]
+            distance = path_data.get('distance', '0')  # 路径距离，单位：米
+            duration = path_data.get('duration', '0')  # 预计耗时，单位：秒
+
+            # 计算小时和分钟
+            duration_hours = int(duration) // 3600
+            duration_minutes = (int(duration) % 3600) // 60
+            time_str = ""
+            if duration_hours > 0:
+                time_str += f"{duration_hours}小时"
+            if duration_minutes > 0:
+                time_str += f"{duration_minutes}分钟"
+            if not time_str: # 如果时间很短，显示秒
+                time_str = f"{int(duration)}秒"
+
+            # 获取路径详情
+            steps = []
+            for i, step in enumerate(path_data.get('steps', []), 1):
+                instruction = step.get('instruction', '').replace('<[^>]+>', '')  # 去除HTML标签
+                road_name = step.get('road', '未知道路')
+                step_distance = step.get('distance', '0')
+                steps.append(f"{i}. {instruction} - {road_name} ({step_distance}米)")
+
+            result = f"骑行路线规划结果:\\n"
+            result += f"总距离: {float(distance)/1000:.1f}公里\\n"
+            result += f"预计耗时: {time_str}\\n"
+            result += "\\n详细路线:\\n"
+            result += "\\n".join(steps)
+
+            return result
+        else:
+            # 返回更详细的错误信息，包括高德返回的errmsg和errdetail
+            error_msg = data.get('errmsg', '未知错误')
+            error_detail = data.get('errdetail', '')
+            return f"骑行路径规划失败: API状态码: {data.get('errcode')}, 信息: {error_msg}, 详情: {error_detail}, 原始返回: {data}"
+    else:
+        return f"API请求失败: HTTP状态码: {response.status_code}, 响应内容: {response.text}"
+
+async def _aplan_cycling_route(origin: str, destination: str) -> str:
+    try:
+        response = await http_client.aget(_cycling_route_url(origin, destination))
+        return _format_cycling_route(response)
+    except Exception as e:
+        return f"规划骑行路线时发生严重错误: {str(e)}"
+
 # 高德地图骑行路线规划工具
-@tool
+@async_tool(_aplan_cycling_route)
 def plan_cycling_route(origin: str, destination: str) -> str:
     """
     使用高德地图API规划骑行路线
@@ -214,57 +348,45 @@ def plan_cycling_route(origin: str, destination: str) -> str:
     :return: 骑行路径规划结果的文本描述
     """
     try:
-        # 使用V4版本的骑行路径规划API
-        url = f"https://restapi.amap.com/v4/direction/bicycling?key={AMAP_KEY}&origin={origin}&destination={destination}"
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            # V4 API的成功状态码通常是0 (errcode) 并且有data字段
-            if data.get('errcode') == 0 and data.get('data') and data['data'].get('paths'):
-                # V4 API的路径信息在 data['paths'] 下，通常只有一个path
-                path_data = data['data']['paths'][0] 
-                distance = path_data.get('distance', '0')  # 路径距离，单位：米
-                duration = path_data.get('duration', '0')  # 预计耗时，单位：秒
-                
-                # 计算小时和分钟
-                duration_hours = int(duration) // 3600
-                duration_minutes = (int(duration) % 3600) // 60
-                time_str = ""
-                if duration_hours > 0:
-                    time_str += f"{duration_hours}小时"
-                if duration_minutes > 0:
-                    time_str += f"{duration_minutes}分钟"
-                if not time_str: # 如果时间很短，显示秒
-                    time_str = f"{int(duration)}秒"
-
-                # 获取路径详情
-                steps = []
-                for i, step in enumerate(path_data.get('steps', []), 1):
-                    instruction = step.get('instruction', '').replace('<[^>]+>', '')  # 去除HTML标签
-                    road_name = step.get('road', '未知道路') 
-                    step_distance = step.get('distance', '0')
-                    steps.append(f"{i}. {instruction} - {road_name} ({step_distance}米)")
-                
-                result = f"骑行路线规划结果:\\n"
-                result += f"总距离: {float(distance)/1000:.1f}公里\\n"
-                result += f"预计耗时: {time_str}\\n"
-                result += "\\n详细路线:\\n"
-                result += "\\n".join(steps)
-                
-                return result
+        response = http_client.get(_cycling_route_url(origin, destination))
+        return _format_cycling_route(response)
+    except Exception as e:
+        return f"规划骑行路线时发生严重错误: {str(e)}"
+
+def _geocode_url(address, city):
+    url = f"https://restapi.amap.com/v3/geocode/geo?key={AMAP_KEY}&address={address}"
+    if city:
+        url += f"&city={city}"
+    return url
+
+def _format_geocode(response, address):
+    if response.status_code == 200:
+        data = response.json()
+        if data['status'] == '1' and data['count'] != '0' and data.get('geocodes'):
+            # 通常取第一个结果
+            location = data['geocodes'][0].get('location')
+            if location:
+                return str(location) # 直接返回 "经度,纬度" 字符串
             else:
-                # 返回更详细的错误信息，包括高德返回的errmsg和errdetail
-                error_msg = data.get('errmsg', '未知错误')
-                error_detail = data.get('errdetail', '')
-                return f"骑行路径规划失败: API状态码: {data.get('errcode')}, 信息: {error_msg}, 详情: {error_detail}, 原始返回: {data}"
+                return "地理编码失败：API返回结果中未找到location字段。"
         else:
-            return f"API请求失败: HTTP状态码: {response.status_code}, 响应内容: {response.text}"
+            error_info = data.get('info', '未知错误')
+            # 特殊处理 "INVALID_USER_KEY" 等常见问题
+            if data.get('infocode') == '10001': # INVALID_USER_KEY
+                error_info = "高德API Key无效或权限不足。"
+            return f"地理编码失败：未能找到地址 '{address}'。高德API返回: status={data.get('status')}, info={error_info}"
+    else:
+        return f"地理编码API请求失败: HTTP状态码 {response.status_code}, 响应: {response.text}"
+
+async def _aget_coordinates_from_address(address: str, city: str = None) -> str:
+    try:
+        response = await http_client.aget(_geocode_url(address, city))
+        return _format_geocode(response, address)
     except Exception as e:
-        return f"规划骑行路线时发生严重错误: {str(e)}"
+        return f"地理编码工具发生错误: {str(e)}"
 
 # 高德地图地理编码工具
-@tool
+@async_tool(_aget_coordinates_from_address)
 def get_coordinates_from_address(address: str, city: str = None) -> str:
     """
     使用高德地图API将详细地址描述转换为经纬度坐标。
@@ -273,28 +395,8 @@ def get_coordinates_from_address(address: str, city: str = None) -> str:
     :return: 成功时返回"经度,纬度"格式的字符串；失败时返回错误信息。
     """
     try:
-        url = f"https://restapi.amap.com/v3/geocode/geo?key={AMAP_KEY}&address={address}"
-        if city:
-            url += f"&city={city}"
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == '1' and data['count'] != '0' and data.get('geocodes'):
-                # 通常取第一个结果
-                location = data['geocodes'][0].get('location')
-                if location:
-                    return str(location) # 直接返回 "经度,纬度" 字符串
-                else:
-                    return "地理编码失败：API返回结果中未找到location字段。"
-            else:
-                error_info = data.get('info', '未知错误')
-                # 特殊处理 "INVALID_USER_KEY" 等常见问题
-                if data.get('infocode') == '10001': # INVALID_USER_KEY
-                    error_info = "高德API Key无效或权限不足。"
-                return f"地理编码失败：未能找到地址 '{address}'。高德API返回: status={data.get('status')}, info={error_info}"
-        else:
-            return f"地理编码API请求失败: HTTP状态码 {response.status_code}, 响应: {response.text}"
+        response = http_client.get(_geocode_url(address, city))
+        return _format_geocode(response, address)
     except Exception as e:
         return f"地理编码工具发生错误: {str(e)}"
 
@@ -312,81 +414,109 @@ def get_web_data(query: str) -> str:
         return f"搜索时发生错误：{str(e)}。建议稍后重试或换个搜索词。"
 
 # 定义和风天气API工具
-@tool
+QWEATHER_KEY = "你的和风天气API Key"
+QWEATHER_TTL = 1800  # 和风天气逐小时预报缓存时间（秒）
+
+def _hefeng_url(city_id):
+    # 构建API请求URL - 使用24小时预报API
+    return f"https://devapi.qweather.com/v7/weather/24h?location={city_id}&key={QWEATHER_KEY}"
+
+def _parse_hefeng_response(response):
+    print(f"API响应状态码: {response.status_code}")
+    if response.status_code != 200:
+        raise RuntimeError(f"API请求失败: {response.status_code}, 响应内容: {response.text}")
+    return response.json()
+
+def fetch_hefeng_data(city_id):
+    """请求和风天气24小时预报API，返回解析后的JSON数据"""
+    url = _hefeng_url(city_id)
+    print(f"正在请求天气API: {url}")
+    return _parse_hefeng_response(http_client.get(url))
+
+async def afetch_hefeng_data(city_id):
+    """fetch_hefeng_data 的异步版本"""
+    url = _hefeng_url(city_id)
+    print(f"正在请求天气API: {url}")
+    return _parse_hefeng_response(await http_client.aget(url))
+
+def _resolve_city_id(city_name):
+    # 在城市索引中查找城市ID（精确匹配优先，其次部分匹配）
+    city_info = city_gazetteer.lookup(city_name)
+    return city_info['Location_ID'] if city_info else None
+
+def _format_hefeng_weather(data, city_name):
+    if data['code'] == '200':
+        # 获取未来24小时的天气信息
+        hourly_forecast = data['hourly']
+        if not hourly_forecast:
+            return f"未获取到{city_name}的天气信息"
+
+        # 格式化天气信息
+        weather_info = []
+        for hour in hourly_forecast[:24]:  # 只显示未来24小时的预报
+            weather_info.append(f"""
+            预报时间: {hour['fxTime']}
+            天气: {hour['text']}
+            温度: {hour['temp']}°C
+            风向: {hour['windDir']}
+            风力: {hour['windScale']}级
+            风速: {hour['windSpeed']}km/h
+            湿度: {hour['humidity']}%
+            降水量: {hour['precip']}mm
+            气压: {hour['pressure']}hPa
+            """)
+
+        return f"城市: {city_name}\n未来24小时天气预报:\n" + "\n".join(weather_info)
+    else:
+        return f"获取天气信息失败: {data['code']}, 错误信息: {data.get('message', '未知错误')}"
+
+def _is_hefeng_ok(data):
+    return data.get('code') == '200'
+
+async def _aget_hefeng_weather(city_name: str) -> str:
+    try:
+        print("cityname",city_name)
+        city_id = _resolve_city_id(city_name)
+        if city_id is None:
+            return f"未找到城市 {city_name} 的信息，请检查城市名称是否正确"
+
+        data = await weather_cache.aget("qweather", city_id, lambda: afetch_hefeng_data(city_id),
+                                        ttl=QWEATHER_TTL, should_cache=_is_hefeng_ok)
+        return _format_hefeng_weather(data, city_name)
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"详细错误信息: {error_trace}")
+        return f"获取天气信息时发生错误: {str(e)}"
+
+@async_tool(_aget_hefeng_weather)
 def get_hefeng_weather(city_name: str) -> str:
     """使用和风天气API获取指定城市的天气信息"""
     try:
-        # 打印数据框的列名
         print("cityname",city_name)
-        print(f"数据框列名: {city_df.columns.tolist()}")
-        
-        # 在数据框中查找城市ID
-        if 'Location_Name_ZH' not in city_df.columns:
-            return f"数据框中没有找到Location_Name_ZH列，可用的列名: {city_df.columns.tolist()}"
-            
-        # 使用Location_Name_ZH列进行精确匹配
-        city_info = city_df[city_df['Location_Name_ZH'] == city_name]
-        print("city_info:",city_info)
-        if city_info.empty:
-            # 如果没有找到完全匹配，尝试部分匹配
-            city_info = city_df[city_df['Location_Name_ZH'].str.contains(city_name, na=False)]
-            
-        if city_info.empty:
+        city_id = _resolve_city_id(city_name)
+        if city_id is None:
             return f"未找到城市 {city_name} 的信息，请检查城市名称是否正确"
-        
-        # 获取第一个匹配的城市ID
-        if 'Location_ID' not in city_df.columns:
-            return f"数据框中没有找到Location_ID列，可用的列名: {city_df.columns.tolist()}"
-            
-        city_id = city_info['Location_ID'].values[0]
-        api_key = "你的和风天气API Key"
-        
-        # 构建API请求URL - 使用24小时预报API
-        url = f"https://devapi.qweather.com/v7/weather/24h?location={city_id}&key={api_key}"
-        print(f"正在请求天气API: {url}")
-        
-        # 发送请求
-        response = requests.get(url)
-        print(f"API响应状态码: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"API响应数据: {data}")
-            
-            if data['code'] == '200':
-                # 获取未来24小时的天气信息
-                hourly_forecast = data['hourly']
-                if not hourly_forecast:
-                    return f"未获取到{city_name}的天气信息"
-                
-                # 格式化天气信息
-                weather_info = []
-                for hour in hourly_forecast[:24]:  # 只显示未来24小时的预报
-                    weather_info.append(f"""
-                    预报时间: {hour['fxTime']}
-                    天气: {hour['text']}
-                    温度: {hour['temp']}°C
-                    风向: {hour['windDir']}
-                    风力: {hour['windScale']}级
-                    风速: {hour['windSpeed']}km/h
-                    湿度: {hour['humidity']}%
-                    降水量: {hour['precip']}mm
-                    气压: {hour['pressure']}hPa
-                    """)
-                
-                return f"城市: {city_name}\n未来24小时天气预报:\n" + "\n".join(weather_info)
-            else:
-                return f"获取天气信息失败: {data['code']}, 错误信息: {data.get('message', '未知错误')}"
-        else:
-            return f"API请求失败: {response.status_code}, 响应内容: {response.text}"
+
+        # 优先读取缓存，同一城市的并发请求只访问一次上游
+        data = weather_cache.get("qweather", city_id, lambda: fetch_hefeng_data(city_id),
+                                 ttl=QWEATHER_TTL, should_cache=_is_hefeng_ok)
+        return _format_hefeng_weather(data, city_name)
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
         print(f"详细错误信息: {error_trace}")
         return f"获取天气信息时发生错误: {str(e)}"
 
+async def _asearch_knowledge_base(query: str) -> str:
+    try:
+        return await rag.aget_result(query)
+    except Exception as e:
+        print(f"检索知识库时发生错误: {str(e)}")
+        return f"检索知识库时发生错误: {str(e)}"
+
 # RAG工具
-@tool
+@async_tool(_asearch_knowledge_base)
 def search_knowledge_base(query: str) -> str:
     """使用RAG检索知识库中的相关信息"""
     try:
@@ -413,11 +543,15 @@ agent_prompt = ChatPromptTemplate.from_messages([
 2. 给用户提供极佳的旅游攻略，针对当前时节提供吃穿住行的建议，例如结合用户游玩季节以及天气给出穿搭建议，需要具体落实到细节，不能仅仅回答推荐去哪里，需要具体到时间安排好行程，给用户提供一个满意的旅游攻略。
 3. 必须基于检索到的内容进行回答，当RAG知识库内容不足，或问题属于明显的时效性信息时，使用联网搜索。
 
+[Runtime Context]
+以下信息已在本地预先计算，可直接使用，无需再调用 get_time 或 is_time_sensitive_query：
+{runtime_context}
+
 [Steps]
-1. 使用 is_time_sensitive_query 工具检测问题是否具有时效性。
+1. 参考 [Runtime Context] 中的时效性检测结果判断问题是否具有时效性（仅在无法判断时才调用 is_time_sensitive_query 工具）。
 2. 理解用户意图（天气？旅行推荐？时间？热点信息？附近景点？路线规划？）。
 3. 根据检测结果选择工具：
-   - 如果 is_time_sensitive_query 返回"是"，优先使用 get_web_data 联网搜索；
+   - 如果时效性检测结果为"是"，优先使用 get_web_data 联网搜索；
    - 如果返回"否"，优先使用 search_knowledge_base 知识库检索。
 4. 判断是否需要其他工具协助，如天气查询、地点检索、路线规划等。
 5. 合理选择工具并调用，工具调用需符合[Arguments]规则。
@@ -426,7 +560,7 @@ agent_prompt = ChatPromptTemplate.from_messages([
 
 [Tools]
 你可以使用以下工具：
-- get_time: 获取当前月份，用于判断季节。
+- get_time: 获取当前月份，用于判断季节（[Runtime Context] 已提供当前时间，一般无需调用）。
 - get_hefeng_weather: 查询城市的实时天气。
 - get_web_data: 获取实时网络信息。
 - search_knowledge_base: 查询本地旅游知识库。
@@ -476,11 +610,17 @@ agent_prompt = ChatPromptTemplate.from_messages([
 
 # 创建智能体
 agent = create_openai_tools_agent(chat, tools, agent_prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+# 同一步中的多个工具调用并发执行，TOOL_CONCURRENCY 为单步并发上限
+TOOL_CONCURRENCY = 4
+agent_executor = ConcurrentAgentExecutor(agent=agent, tools=tools, verbose=True, max_concurrency=TOOL_CONCURRENCY)
+
+# 前置处理：在本地计算时间、时效性和可能的目的地并注入提示词，减少模型调用工具的轮次
+runtime_context_builder = RuntimeContextBuilder(lambda text: region_matcher.match(text)[0])
+routed_agent = RunnablePassthrough.assign(runtime_context=runtime_context_builder) | agent_executor
 
 # 创建支持多轮对话的智能体，使用RunnableWithMessageHistory创建，并用get_session_history管理对话
 conversational_agent = RunnableWithMessageHistory(
-    agent_executor,
+    routed_agent,
     get_session_history,#通过get_session_history函数，系统能够根据session_id获取和存储聊天记录
     input_messages_key="input",
     history_messages_key="chat_history",
@@ -542,35 +682,16 @@ async def get_weather(request: Request):
         city_name = data.get("location", "北京")
         print(f"获取天气信息: {city_name}")
 
-        # 将中文城市名称转换为拼音
-        city_pinyin = pinyin.get(city_name, format="strip", delimiter="")
-        flag = False
-
-        # 构建出城市天气预报的url地址
-        for province_code, cities in province_dict.items():
-            if city_name in cities:
-                flag = True
-                print(f"找到城市: {city_name}, 拼音: {city_pinyin}, 省份代码: {province_code}")
-                if city_name == "天津":
-                    city_pinyin = "wuqing"
-                elif city_name == "重庆":
-                    city_pinyin = "zhongqing"
-                elif city_name == "深圳":
-                    city_pinyin = "shenzuo"
-                elif city_name == '新疆':
-                    city_pinyin = 'xinzuo'
-                elif city_name == '厦门':
-                    city_pinyin = 'xiamen'
-                url = f"http://www.nmc.cn/publish/forecast/{province_code}/{city_pinyin}.html"
-                print(url)
-                break
-
-        if not flag:
+        # 从启动时生成的URL表中查找城市天气预报的url地址
+        url = nmc_url_table.get(city_name)
+        if url is None:
             print(f"未找到城市: {city_name}")
             return JSONResponse({"weather": [], "error": f"位置 {city_name} 未找到"})
+        print(f"找到城市: {city_name}, URL: {url}")
 
         try:
-            weather_info = fetch_weather_data(url)
+            # 使用共享连接池异步抓取，不阻塞事件循环
+            weather_info = await weather_cache.aget("nmc", city_name, lambda: afetch_weather_data(url), NMC_TTL)
             print(f"获取到天气信息: {len(weather_info)} 天")
             return JSONResponse({"weather": weather_info})
         except Exception as e:
@@ -581,25 +702,62 @@ async def get_weather(request: Request):
         print(f"天气API出错: {str(e)}")
         return JSONResponse({"weather": [], "error": str(e)}, status_code=500)
 
+# 天气缓存命中统计，用于评估缓存容量
+@app.get("/weather/cache_stats")
+async def weather_cache_stats():
+    return JSONResponse(weather_cache.stats())
+
+# 会话存储的容量和淘汰统计
+@app.get("/sessions/stats")
+async def session_stats():
+    # SQLite 后端的统计需要查询数据库，在线程池中执行
+    return JSONResponse(await run_in_threadpool(store.stats))
+
+# 知识库各检索模式（向量/词法/融合）的调用次数和耗时
+@app.get("/rag/retrieval_stats")
+async def retrieval_stats():
+    return JSONResponse(rag.retrieval_stats())
+
 # 根据用户的输入来推理，并得到用户想去的地方
 def check_region_in_message(message):
-    # 调用loc_chain来根据用户的消息来推理出用户想去的城市
+    # 先用本地自动机匹配，消息中只有一个明确候选城市时直接返回，无需调用大模型
+    region, status = region_matcher.match(message)
+    if region:
+        region_matcher.record("fast_path")
+        print(f"用户消息提取(本地匹配): {message} -> 提取城市: {region}")
+        return region
+    region_matcher.record(status)
+    region_matcher.record("llm_fallback")
+
+    # 没有命中或存在歧义时，调用loc_chain来根据用户的消息来推理出用户想去的城市
     try:
         region = loc_chain.invoke({"text": message})
         print(f"用户消息提取: {message} -> 提取城市: {region}")
         # 确保提取的地区是字符串
         region = str(region).strip()
-        if region in locations:
+        if region in region_matcher.locations:
             return region
-        # 检查是否包含在locations的值中（不区分大小写）
-        for loc in locations:
-            if region.lower() == loc.lower():
-                return loc
+        # 模型输出带有后缀或别名时（如"厦门市"），再用本地自动机归一化
+        normalized, _ = region_matcher.match(region)
+        if normalized:
+            return normalized
         print(f"提取的地区 '{region}' 不在已知地点列表中")
     except Exception as e:
         print(f"提取地区出错: {str(e)}")
     return None
 
+# 语义答案缓存命中统计
+@app.get("/chain/answer_cache/stats")
+async def answer_cache_stats():
+    if answer_cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **answer_cache.stats()})
+
+# 目的地识别的本地命中与大模型兜底统计
+@app.get("/process_message/stats")
+async def region_stats():
+    return JSONResponse(region_matcher.stats())
+
 # 根据用户的输入来获取城市名称是否能够正常获得
 @app.post("/process_message")
 async def process_message(request: Request):
@@ -623,16 +781,56 @@ async def process_message(request: Request):
         print(f"处理消息出错: {str(e)}")
         return JSONResponse({"error": str(e), "response": "处理消息时出错"}, status_code=500)
 
-# 返回网站轮播图的景点图片链接:
+# 景点列表的浏览器/代理缓存时间（秒），过期后凭ETag重新验证
+HOTSPOT_CACHE_CONTROL = "public, max-age=300"
+
+
+def _parse_hotspot_params(offset, limit, fields):
+    """校验景点分页和字段参数，非法时抛出 ValueError"""
+    offset = int(offset or 0)
+    limit = None if limit in (None, "") else int(limit)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset 和 limit 不能为负数")
+    if isinstance(fields, str):
+        # GET 查询参数中以逗号分隔
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+        raise ValueError("fields 必须是字段名列表")
+    return offset, limit, fields or None
+
+
+def _hotspot_response(request, location, offset, limit, fields):
+    """内容未变化（If-None-Match 命中）时返回304，否则返回景点列表并附带ETag"""
+    try:
+        offset, limit, fields = _parse_hotspot_params(offset, limit, fields)
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": f"参数错误: {str(e)}"}, status_code=400)
+
+    etag = attraction_catalog.etag(location, offset, limit, fields)
+    headers = {"ETag": etag, "Cache-Control": HOTSPOT_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    # 提取景点名称和图片链接
+    hot_spots_with_images, total = attraction_catalog.get(location, offset, limit, fields)
+    return JSONResponse({"hotspot": hot_spots_with_images, "total": total}, headers=headers)
+
+# 返回网站轮播图的景点图片链接（GET 可被浏览器和代理缓存，fields 以逗号分隔，如 景点名称,图片链接）
+@app.get("/hotspot")
+async def get_hotspot_cached(request: Request, location: str = "北京", offset: str = "0",
+                             limit: str = None, fields: str = None):
+    return _hotspot_response(request, location, offset, limit, fields)
+
+# 返回网站轮播图的景点图片链接（兼容旧的POST调用）:
 @app.post("/hotspot")
 async def get_hotspot(request: Request):
     data = await request.json()
     location = data.get("location", "北京")
-    with open('all.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    # 提取景点名称和图片链接
-    hot_spots_with_images = data.get(location, [])
-    return JSONResponse({"hotspot": hot_spots_with_images})
+    offset = data.get("offset", 0)
+    limit = data.get("limit")
+    fields = data.get("fields")  # 例如 ["景点名称", "图片链接"]
+    return _hotspot_response(request, location, offset, limit, fields)
 
 from fastapi.responses import StreamingResponse
 import json
@@ -649,35 +847,79 @@ async def pdf_retrieval(request: Request):
     if not question:
         return JSONResponse({"error": "No question provided"}, status_code=400)
 
+    def ndjson(payload):
+        return json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+
     async def generate_stream():
+        streamed = False  # 是否已输出过最终回答
+        answer_run = None  # 正在输出文本的模型步骤（run_id）
+        tool_runs = set()  # 发起了工具调用的模型步骤，其文本不属于最终回答
+        final_answer = None
+        cache_vector = None
         try:
-            # 使用智能体处理问题
-            response = await conversational_agent.ainvoke(
+            # 首轮对话且非时效性问题时，先查语义答案缓存
+            # 会话历史可能存放在SQLite中，读写放到线程池，不阻塞事件循环
+            history = get_session_history(session_id)
+            cacheable = (answer_cache is not None and not detect_time_sensitive(question)
+                         and not await run_in_threadpool(lambda: history.messages))
+            if cacheable:
+                cached_answer, cache_vector = await answer_cache.alookup(question)
+                if cached_answer is not None:
+                    await run_in_threadpool(history.add_messages,
+                                            [HumanMessage(content=question), AIMessage(content=cached_answer)])
+                    yield ndjson({"answer": cached_answer, "session_id": session_id, "cached": True})
+                    return
+
+            # 订阅智能体的事件流：模型每产生一个token就立即下发，工具调用进度也走同一通道
+            async for event in conversational_agent.astream_events(
                 {"input": question},
                 config={"configurable": {"session_id": session_id}},
-            )
-            
-            answer_content = response["output"]
-            
-            # 将回答内容分成小块进行流式输出
-            chunk_size = 20
-            for i in range(0, len(answer_content), chunk_size):
-                chunk = answer_content[i:i + chunk_size]
-                try:
-                    json_str = json.dumps({"answer": chunk, "session_id": session_id}, ensure_ascii=False)
-                    yield json_str + "\n"
-                    await asyncio.sleep(0.05)
-                except Exception as e:
-                    logging.error(f"JSON serialization error: {str(e)}")
-                    continue
-            
+                version="v2",
+            ):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    chunk = event["data"]["chunk"]
+                    run_id = event["run_id"]
+                    if run_id in tool_runs:
+                        continue
+                    if getattr(chunk, "tool_call_chunks", None):
+                        # 该步骤调用工具，不是最终回答；若已先输出了文本，通知前端丢弃
+                        tool_runs.add(run_id)
+                        if answer_run == run_id:
+                            answer_run = None
+                            streamed = False
+                            yield ndjson({"event": "answer_reset", "session_id": session_id})
+                        continue
+                    content = chunk.content
+                    if isinstance(content, str) and content:
+                        answer_run = run_id
+                        streamed = True
+                        yield ndjson({"answer": content, "session_id": session_id})
+                elif kind == "on_tool_start":
+                    yield ndjson({"event": "tool_start", "tool": event["name"],
+                                  "input": event["data"].get("input"), "session_id": session_id})
+                elif kind == "on_tool_end":
+                    output = str(event["data"].get("output", ""))
+                    yield ndjson({"event": "tool_end", "tool": event["name"],
+                                  "output": output[:200], "session_id": session_id})
+                elif kind == "on_chain_end" and event["name"] == agent_executor.get_name():
+                    output = event["data"].get("output") or {}
+                    if isinstance(output, dict) and output.get("output"):
+                        final_answer = output["output"]
+                        if not streamed:
+                            # 模型不支持流式输出时，退回为一次性下发最终回答
+                            streamed = True
+                            yield ndjson({"answer": final_answer, "session_id": session_id})
+
+            if cacheable and final_answer:
+                await answer_cache.astore(question, final_answer, cache_vector)
+
         except Exception as e:
             logging.error(f"Error in agent execution: {str(e)}")
-            error_response = json.dumps({
+            yield ndjson({
                 "error": "处理请求时发生错误",
                 "detail": str(e)
-            }, ensure_ascii=False)
-            yield error_response + "\n"
+            })
 
     return StreamingResponse(generate_stream(), media_type="application/x-ndjson")
 
@@ -788,21 +1030,19 @@ async def admin_login(request: Request):
 async def upload_pdf(file: UploadFile = File(...), token: dict = Depends(verify_token)):
     try:
         # 确保文件是PDF格式
-        if not file.filename.endswith('.pdf'):
+        if not file.filename.lower().endswith('.pdf'):
             return JSONResponse(
                 status_code=400,
                 content={"message": "只支持PDF文件格式"}
             )
-        
-        # 保存文件到指定目录
-        file_path = f"app/dataset/pdf/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
+
+        # 分块写入目录，内容与已有文件相同时跳过
+        result = await run_in_threadpool(pdf_uploads.save_stream, file.filename, file.file)
+        if result["status"] == "rejected":
+            return JSONResponse(status_code=400, content={"message": result["message"]})
         return JSONResponse(
             status_code=200,
-            content={"message": "文件上传成功"}
+            content={"message": result["message"], "file": result}
         )
     except Exception as e:
         return JSONResponse(
@@ -810,51 +1050,62 @@ async def upload_pdf(file: UploadFile = File(...), token: dict = Depends(verify_
             content={"message": f"文件上传失败：{str(e)}"}
         )
 
-@app.post("/create-rag")
-async def create_rag(token: dict = Depends(verify_token)):
+# 批量上传PDF或zip压缩包，ingest=true 时上传完成后排队重建知识库
+@app.post("/upload-pdfs")
+async def upload_pdfs(files: List[UploadFile] = File(...), ingest: bool = False,
+                      token: dict = Depends(verify_token)):
     try:
-        # 获取当前文件所在目录的路径
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # 构建CreateRag.py的完整路径
-        create_rag_path = os.path.join(current_dir, 'CreateRag.py')
-        
-        print(f"正在执行CreateRag.py，路径: {create_rag_path}")
-        
-        # 检查文件是否存在
-        if not os.path.exists(create_rag_path):
-            print(f"CreateRag.py文件不存在: {create_rag_path}")
-            return JSONResponse({
-                'message': 'CreateRag.py文件不存在',
-                'path': create_rag_path
-            }, status_code=404)
-        
-        # 执行CreateRag.py
-        print("开始执行CreateRag.py")
-        result = subprocess.run([sys.executable, create_rag_path], 
-                              capture_output=True, 
-                              text=True)
-        
-        print(f"执行结果 - 返回码: {result.returncode}")
-        print(f"标准输出: {result.stdout}")
-        print(f"标准错误: {result.stderr}")
-        
-        if result.returncode == 0:
-            return JSONResponse({
-                'message': 'RAG知识库创建成功',
-                'output': result.stdout
-            })
-        else:
-            return JSONResponse({
-                'message': 'RAG知识库创建失败',
-                'error': result.stderr
-            }, status_code=500)
-            
+        results = []
+        for file in files:
+            # 文件读写在线程池中分块进行，不阻塞事件循环
+            results.extend(await run_in_threadpool(pdf_uploads.save_upload, file.filename, file.file))
+            await file.close()
+
+        saved = [r for r in results if r["status"] == "saved"]
+        content = {
+            "message": f"上传完成：新增 {len(saved)} 个文件，"
+                       f"跳过重复 {sum(r['status'] == 'duplicate' for r in results)} 个，"
+                       f"拒绝 {sum(r['status'] == 'rejected' for r in results)} 个",
+            "files": results,
+        }
+        if ingest and saved:
+            job, _ = await run_in_threadpool(ingestion_jobs.submit, queue_if_running=True)
+            content["job_id"] = job.job_id
+        return JSONResponse(status_code=200, content=content)
     except Exception as e:
-        print(f"执行过程中发生错误: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"文件上传失败：{str(e)}"}
+        )
+
+@app.post("/create-rag")
+async def create_rag(token: dict = Depends(verify_token)):
+    # 在后台任务中重建知识库，立即返回任务ID，进度通过 /create-rag/{job_id} 查询
+    job, created = await run_in_threadpool(ingestion_jobs.submit)
+    if not created:
         return JSONResponse({
-            'message': '执行过程中发生错误',
-            'error': str(e)
-        }, status_code=500)
+            'message': '已有知识库重建任务正在执行',
+            'job_id': job.job_id,
+            'job': job.to_dict()
+        }, status_code=409)
+    print(f"知识库重建任务已启动: {job.job_id}")
+    return JSONResponse({
+        'message': 'RAG知识库重建任务已启动',
+        'job_id': job.job_id
+    }, status_code=202)
+
+# 查询知识库重建任务的状态和进度（文件数、文本块数、吞吐量）
+@app.get("/create-rag/{job_id}")
+async def create_rag_status(job_id: str, token: dict = Depends(verify_token)):
+    job = await run_in_threadpool(ingestion_jobs.get, job_id)
+    if job is None:
+        return JSONResponse({'message': '任务不存在', 'job_id': job_id}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+# 应用退出时关闭共享HTTP连接池
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
 
 if __name__ == "__main__":
     import uvicorn
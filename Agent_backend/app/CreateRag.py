@@ -1,17 +1,23 @@
 #开启chroma_db服务后，运行此段代码，将pdf导入数据库
+import os
 from app.rag.pdf_processor import PDFProcessor
 from app.models.model import get_qwen_models
 
-llm, chat, embed = get_qwen_models()
-directory = "dataset/pdf"
-persist_path = "chroma_db"
-server_type = "local"
+# 多进程解析PDF时子进程会重新导入本模块（Windows为spawn方式），入口代码必须放在 main 判断下
+if __name__ == "__main__":
+    llm, chat, embed = get_qwen_models()
+    directory = "dataset/pdf"
+    persist_path = "chroma_db"
+    server_type = "local"
+    # 解析PDF的进程数，未设置时使用CPU核数
+    parse_workers = int(os.getenv("PDF_PARSE_WORKERS", "0")) or None
 
-# 创建 PDFProcessor 实例
-pdf_processor = PDFProcessor(directory=directory,
-                             chroma_server_type=server_type,
-                             persist_path=persist_path,
-                             embed=embed)
+    # 创建 PDFProcessor 实例
+    pdf_processor = PDFProcessor(directory=directory,
+                                 chroma_server_type=server_type,
+                                 persist_path=persist_path,
+                                 embed=embed,
+                                 parse_workers=parse_workers)
 
-# 处理 PDF 文件
-pdf_processor.process_pdfs()
\ No newline at end of file
+    # 处理 PDF 文件
+    pdf_processor.process_pdfs()
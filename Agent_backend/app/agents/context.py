@@ -0,0 +1,49 @@
+import re
+from datetime import datetime
+
+# 时效性关键词列表
+TIME_KEYWORDS = ["最近", "最新", "近期", "近来", "刚刚", "刚", "即将", "现在",
+                 "本月", "本周", "今年", "明年", "明天", "当前", "正在进行", "刚结束"]
+# 事件相关词
+EVENT_KEYWORDS = ["活动", "展览", "演出", "赛事", "比赛", "促销", "优惠", "打折", "节日",
+                  "庆典", "开幕", "开业", "上新", "首发"]
+# 日期或年份模式，如 '2025年6月15日'
+DATE_PATTERN = re.compile(r"\d{4}年|\d{1,2}月\d{1,2}日")
+
+
+def current_time_text(now=None):
+    """当前时间的文字描述"""
+    now = now or datetime.now()
+    return now.strftime("当前时间是：%Y年%m月%d日 %H:%M")
+
+
+def detect_time_sensitive(query):
+    """判断提问是否属于时效性问题"""
+    q = query.lower()
+    if any(kw in q for kw in TIME_KEYWORDS):
+        return True
+    if any(kw in q for kw in EVENT_KEYWORDS):
+        return True
+    return DATE_PATTERN.search(q) is not None
+
+
+class RuntimeContextBuilder:
+    """
+    智能体前置处理：在本地计算当前时间、时效性和可能的目的地，
+    以文本形式注入提示词，省去调用 get_time / is_time_sensitive_query 的模型往返
+    """
+
+    def __init__(self, region_finder):
+        self.region_finder = region_finder  # 接收消息文本，返回城市名或None
+
+    def build(self, query):
+        region = self.region_finder(query)
+        lines = [
+            f"- {current_time_text()}",
+            f"- 时效性检测结果：{'是' if detect_time_sensitive(query) else '否'}",
+            f"- 可能的目的地：{region or '未识别'}",
+        ]
+        return "\n".join(lines)
+
+    def __call__(self, inputs):
+        return self.build(inputs.get("input", ""))
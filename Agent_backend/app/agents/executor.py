@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.agents import AgentExecutor
+
+
+class _DeferredAction:
+    """延迟执行的工具调用：记录参数，由 ConcurrentAgentExecutor 统一并发执行"""
+    __slots__ = ("args", "kwargs")
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    并发执行同一步中多个工具调用的 AgentExecutor
+    模型在一步中给出多个工具调用（如同时查询起点和终点坐标）时，
+    这些调用彼此独立，按 max_concurrency 上限并发执行，结果仍按原顺序返回，
+    单步耗时由各工具耗时之和降为最慢的那个。
+    """
+
+    max_concurrency: int = 4  # 同一步内最多并发执行的工具调用数
+
+    def _perform_agent_action(self, *args, **kwargs):
+        # 只记录调用，真正执行在 _iter_next_step 中统一调度
+        return _DeferredAction(args, kwargs)
+
+    async def _aperform_agent_action(self, *args, **kwargs):
+        return _DeferredAction(args, kwargs)
+
+    def _run_action(self, deferred):
+        return super()._perform_agent_action(*deferred.args, **deferred.kwargs)
+
+    async def _arun_action(self, deferred, limit):
+        async with limit:
+            return await super()._aperform_agent_action(*deferred.args, **deferred.kwargs)
+
+    def _iter_next_step(self, *args, **kwargs):
+        deferred = []
+        for item in super()._iter_next_step(*args, **kwargs):
+            if isinstance(item, _DeferredAction):
+                deferred.append(item)
+            else:
+                yield item
+
+        if len(deferred) <= 1 or self.max_concurrency <= 1:
+            for action in deferred:
+                yield self._run_action(action)
+            return
+
+        # 每个线程复制当前上下文，保证回调和追踪信息正确传递
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(deferred))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self._run_action, action)
+                       for action in deferred]
+            for future in futures:
+                yield future.result()
+
+    async def _aiter_next_step(self, *args, **kwargs):
+        deferred = []
+        async for item in super()._aiter_next_step(*args, **kwargs):
+            if isinstance(item, _DeferredAction):
+                deferred.append(item)
+            else:
+                yield item
+
+        limit = asyncio.Semaphore(max(self.max_concurrency, 1))
+        results = await asyncio.gather(*[self._arun_action(action, limit) for action in deferred])
+        for step in results:
+            yield step
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的向量化模型包装器，键为 模型名 + 文本类型(query/document) + 文本内容的sha256
+    - 第一层：进程内 LRU（最近使用的 memory_size 条）；
+    - 第二层：SQLite 磁盘缓存，重启或重新导入相同PDF时不再重复调用向量化接口。
+    """
+
+    def __init__(self, underlying, model_name, cache_path="embedding_cache.db", memory_size=10000):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )""")
+
+    def _connection(self):
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text, kind):
+        # DashScope 对查询和文档使用不同的 text_type，向量不同，需分开缓存
+        return f"{self.model_name}:{kind}:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, texts, kind):
+        """返回 (keys, 已缓存的向量列表(未命中为None))"""
+        keys = [self._key(t, kind) for t in texts]
+        vectors = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[i] = vector
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.append(i)
+
+        if missing:
+            conn = self._connection()
+            wanted = {keys[i] for i in missing}
+            found = {}
+            wanted_list = list(wanted)
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(wanted_list), 500):
+                batch = wanted_list[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, blob in conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                    found[key] = array("f", blob).tolist()
+            for i in missing:
+                vector = found.get(keys[i])
+                if vector is not None:
+                    vectors[i] = vector
+                    self._remember(keys[i], vector)
+            with self._lock:
+                self._stats["disk_hits"] += sum(1 for i in missing if vectors[i] is not None)
+        return keys, vectors
+
+    def _save(self, keys, vectors):
+        rows = [(key, array("f", vector).tobytes()) for key, vector in zip(keys, vectors)]
+        self._connection().executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+
+    def _pending(self, texts, vectors):
+        """未命中的文本去重后按首次出现顺序返回"""
+        pending = OrderedDict()
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                pending.setdefault(texts[i], []).append(i)
+        with self._lock:
+            self._stats["misses"] += len(pending)
+        return pending
+
+    def _fill(self, keys, vectors, pending, computed):
+        new_keys, new_vectors = [], []
+        for (text, positions), vector in zip(pending.items(), computed):
+            vector = list(vector)
+            for i in positions:
+                vectors[i] = vector
+            new_keys.append(keys[positions[0]])
+            new_vectors.append(vector)
+        if new_keys:
+            self._save(new_keys, new_vectors)
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys, vectors = self._lookup(texts, "document")
+        pending = self._pending(texts, vectors)
+        computed = self.underlying.embed_documents(list(pending.keys())) if pending else []
+        return self._fill(keys, vectors, pending, computed)
+
+    def embed_query(self, text):
+        keys, vectors = self._lookup([text], "query")
+        if vectors[0] is not None:
+            return vectors[0]
+        with self._lock:
+            self._stats["misses"] += 1
+        vector = list(self.underlying.embed_query(text))
+        self._save(keys, [vector])
+        return vector
+
+    # 异步版本中SQLite的读写放到线程中执行，不阻塞事件循环
+    async def aembed_documents(self, texts):
+        texts = list(texts)
+        keys, vectors = await asyncio.to_thread(self._lookup, texts, "document")
+        pending = self._pending(texts, vectors)
+        computed = await self.underlying.aembed_documents(list(pending.keys())) if pending else []
+        return await asyncio.to_thread(self._fill, keys, vectors, pending, computed)
+
+    async def aembed_query(self, text):
+        keys, vectors = await asyncio.to_thread(self._lookup, [text], "query")
+        if vectors[0] is not None:
+            return vectors[0]
+        with self._lock:
+            self._stats["misses"] += 1
+        vector = list(await self.underlying.aembed_query(text))
+        await asyncio.to_thread(self._save, keys, [vector])
+        return vector
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        return stats
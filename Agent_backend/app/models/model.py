@@ -8,6 +8,8 @@ current_dir = os.path.dirname(__file__)
 conf_file_path_qwen = os.path.join(current_dir, '..', 'conf', '.qwen')
 # 加载千问环境变量
 load_dotenv(dotenv_path=conf_file_path_qwen)
+# 向量缓存文件路径，默认放在 app 目录下，与运行目录无关
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(current_dir, '..', 'embedding_cache.db'))
 
 def get_qwen_models():
     """
@@ -19,9 +21,13 @@ def get_qwen_models():
     # chat 大模型
     from langchain_community.chat_models import ChatTongyi
     chat = ChatTongyi(model="qwen-max", temperature=0.1, top_p=0.2,max_tokens=1024)
-    # embedding 大模型
+    # embedding 大模型，外层包装两级缓存（内存LRU + SQLite），相同文本不再重复调用接口
     from langchain_community.embeddings import DashScopeEmbeddings
-    embed = DashScopeEmbeddings(model="text-embedding-v3")
+    from .cached_embeddings import CachedEmbeddings
+    embed_model = "text-embedding-v3"
+    embed = CachedEmbeddings(DashScopeEmbeddings(model=embed_model),
+                             model_name=embed_model,
+                             cache_path=embedding_cache_path)
 
 
     return llm, chat, embed
\ No newline at end of file
@@ -0,0 +1,273 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+
+from langchain_core.documents import Document
+
+from .hashing import doc_content_hash
+
+# 索引文件名，与 ChromaDB 的持久化目录放在一起，每个集合一个（文件名沿用旧版本，内容为JSON Lines）
+INDEX_FILENAME = "bm25_index_{collection}.json"
+# 索引文件格式版本：3 起为追加写入的日志（JSON Lines），之前为整体写入的JSON快照
+INDEX_VERSION = 3
+_HEADER = json.dumps({"version": INDEX_VERSION}) + "\n"
+
+# 英文单词/数字 或 连续的中文字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def lexical_index_path(persist_path, collection_name="langchain"):
+    """向量库集合对应的词法索引路径"""
+    return os.path.join(persist_path, INDEX_FILENAME.format(collection=collection_name))
+
+
+def tokenize(text):
+    """中文按字二元组切分（单字保留原字），英文和数字按单词切分"""
+    tokens = []
+    for segment in _TOKEN_PATTERN.findall(text.lower()):
+        if '一' <= segment[0] <= '鿿' and len(segment) > 1:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+class BM25Index:
+    """
+    基于字二元组的 BM25 词法索引，与 ChromaDB 中的文本块一一对应（以文本块ID为键）
+    专有名词（如 环岛路、五大道、鼓浪屿）在向量检索中容易漏召回，用词法检索补充。
+    索引文件保存在 chroma_db 目录下，是追加写入的日志：首行为版本号，之后每行添加或删除一个文本块，
+    同一ID以最后一行为准。
+    - 导入时以 load=False 打开，只追加本次的变化，不在内存中保存已有的文本块，保存开销与本次写入量成正比；
+    - 检索时以 load=True 打开，文件变化时只读取新追加的行，文件被重写（替换）后才完整重新加载；
+    - 有删除时在导入结束后调用 compact() 去掉失效的行。
+    旧版本的JSON快照格式加载后 legacy 为 True，需要从向量库重建。
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75, load=True):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.load = load
+        self._docs = {}  # 文本块ID -> (文本, 元数据)，load=False 时为空
+        self._pending = []  # 尚未写入文件的日志行
+        self._reset = False  # clear() 之后，保存时重写整个文件
+        self._removed = False  # 写入过删除操作，文件中有失效的行
+        self.legacy = False
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._file_id = None  # (设备号, inode)，文件被替换后变化
+        self._offset = 0  # 已读取到的文件位置
+        self._dirty = True
+        self._postings = {}
+        self._doc_ids = []
+        self._doc_lens = []
+        self._avg_len = 0.0
+        if load:
+            self.maybe_reload()
+        else:
+            self.legacy = self._is_snapshot()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _is_snapshot(self):
+        """索引文件是否为旧版本的JSON快照（只读取首行开头）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                first = f.readline(64)
+        except OSError:
+            return False
+        return bool(first) and first != _HEADER
+
+    def maybe_reload(self):
+        """索引文件被其他进程（如 CreateRag.py）更新后读取变化的部分"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id == self._file_id and stat.st_size == self._offset:
+            return
+        with self._reload_lock:
+            full = file_id != self._file_id or stat.st_size < self._offset
+            base = 0 if full else self._offset
+            with open(self.path, 'rb') as f:
+                f.seek(base)
+                data = f.read()
+
+            docs = None
+            if full:
+                header, _, body = data.partition(b"\n")
+                if header + b"\n" != _HEADER.encode('utf-8'):
+                    # 旧版本快照，整体加载
+                    snapshot = json.loads(data.decode('utf-8'))
+                    docs = {item['id']: (item['text'], item.get('metadata', {})) for item in snapshot.get('docs', [])}
+                    with self._lock:
+                        self._docs = docs
+                        self.legacy = True
+                        self._file_id, self._offset = file_id, len(data)
+                        self._dirty = True
+                    logging.info(f"词法索引已加载（旧版本格式）: {len(docs)} 个文本块")
+                    return
+                docs = {}
+                base, data = len(header) + 1, body
+
+            # 写入方可能正在追加，只处理完整的行
+            end = data.rfind(b"\n") + 1
+            ops = [json.loads(line) for line in data[:end].split(b"\n") if line.strip()]
+            with self._lock:
+                if docs is not None:
+                    self._docs = docs
+                    self.legacy = False
+                for op in ops:
+                    if op.get('removed'):
+                        self._docs.pop(op['id'], None)
+                    else:
+                        self._docs[op['id']] = (op['text'], op.get('metadata', {}))
+                self._file_id, self._offset = file_id, base + end
+                self._dirty = True
+        if full:
+            logging.info(f"词法索引已加载: {len(self._docs)} 个文本块")
+
+    def add_documents(self, docs, ids):
+        """添加文本块（以文本块ID为键，重复添加会覆盖）"""
+        lines = []
+        with self._lock:
+            for doc, doc_id in zip(docs, ids):
+                if not isinstance(doc, Document):
+                    continue
+                metadata = dict(doc.metadata, content_hash=doc_content_hash(doc))
+                lines.append(json.dumps({"id": doc_id, "text": doc.page_content, "metadata": metadata},
+                                        ensure_ascii=False) + "\n")
+                if self.load:
+                    self._docs[doc_id] = (doc.page_content, metadata)
+            self._pending.extend(lines)
+            self._dirty = True
+
+    def remove(self, ids):
+        """按文本块ID删除文本块"""
+        with self._lock:
+            for doc_id in ids:
+                self._pending.append(json.dumps({"id": doc_id, "removed": True}) + "\n")
+                self._docs.pop(doc_id, None)
+                self._removed = True
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}
+            self._pending = []
+            self._reset = True
+            self._removed = False
+            self.legacy = False
+            self._dirty = True
+
+    def save(self):
+        """追加写入尚未保存的变化；clear() 之后或文件不存在时原子地重写整个文件"""
+        with self._lock:
+            lines, self._pending = self._pending, []
+            reset, self._reset = self._reset, False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if reset or not os.path.exists(self.path):
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(_HEADER)
+                f.writelines(lines)
+            os.replace(tmp_path, self.path)
+        elif lines:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+
+    def compact(self):
+        """
+        有删除时重写索引文件，每个文本块ID只保留最后一次添加
+        逐行流式处理，内存中只保存ID
+        """
+        self.save()
+        if not self._removed or self.legacy or not os.path.exists(self.path):
+            return
+        live = {}  # 文本块ID -> 最后一次添加所在的行号
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.readline()
+            for lineno, line in enumerate(f):
+                op = json.loads(line)
+                if op.get('removed'):
+                    live.pop(op['id'], None)
+                else:
+                    live[op['id']] = lineno
+        keep = set(live.values())
+        tmp_path = self.path + ".tmp"
+        with open(self.path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            dst.write(src.readline())
+            for lineno, line in enumerate(src):
+                if lineno in keep:
+                    dst.write(line)
+        os.replace(tmp_path, self.path)
+        self._removed = False
+        logging.info(f"词法索引已压缩: {len(keep)} 个文本块")
+
+    def _build(self):
+        """重建倒排表（调用方需持有锁）"""
+        postings = {}
+        doc_ids = []
+        doc_lens = []
+        for doc_id, (text, _) in self._docs.items():
+            tokens = tokenize(text)
+            idx = len(doc_ids)
+            doc_ids.append(doc_id)
+            doc_lens.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((idx, tf))
+        self._postings = postings
+        self._doc_ids = doc_ids
+        self._doc_lens = doc_lens
+        self._avg_len = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+        self._dirty = False
+
+    def search(self, query, k=20, min_coverage=0.0):
+        """
+        返回 [(Document, BM25分数)]，按分数降序；多个文件中内容相同的文本块只返回一个
+        min_coverage: 文本块至少包含查询中多大比例的词（去重后），过滤只碰巧共有一两个常见词的文本块
+        """
+        self.maybe_reload()
+        with self._lock:
+            if self._dirty:
+                self._build()
+            n = len(self._doc_ids)
+            if n == 0:
+                return []
+            query_tokens = set(tokenize(query))
+            scores = {}
+            matched = {}
+            for token in query_tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for idx, tf in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lens[idx] / self._avg_len)
+                    scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[idx] = matched.get(idx, 0) + 1
+            if min_coverage > 0:
+                needed = min_coverage * len(query_tokens)
+                scores = {idx: score for idx, score in scores.items() if matched[idx] >= needed}
+            results = []
+            seen = set()
+            for idx, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                doc_id = self._doc_ids[idx]
+                text, metadata = self._docs[doc_id]
+                digest = metadata.get('content_hash') or doc_id
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                results.append((Document(page_content=text, metadata=dict(metadata)), score))
+                if len(results) >= k:
+                    break
+            return results
@@ -14,6 +14,7 @@ class ChromaDB:
         self.host = host
         self.port = port
         self.path = persist_path
+        self.collection_name = collection_name
         self.embed = embed
         self.store = None
 
@@ -33,11 +34,64 @@ class ChromaDB:
         if self.store is None:
             raise ValueError("Chroma store init failed!")
 
-    def add_with_langchain(self, docs):
+    def add_with_langchain(self, docs, ids=None):
         """
         将文档添加到数据库
+        Args:
+            docs: 文档列表
+            ids: 文档ID列表，不指定时自动生成
+        """
+        self.store.add_documents(documents=docs, ids=ids)
+
+    def add_embeddings(self, ids, texts, embeddings, metadatas):
+        """
+        写入已经向量化的文档，跳过 langchain 封装中的向量化步骤
+        """
+        self.store._collection.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+
+    def iter_records(self, batch_size=500):
+        """
+        分批读取集合中的全部文档
+        Returns:
+            迭代器，每批为 (ID列表, 文本列表, 向量列表, 元数据列表)
+        """
+        offset = 0
+        while True:
+            batch = self.store._collection.get(include=["documents", "embeddings", "metadatas"],
+                                               limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                return
+            yield batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"]
+            offset += len(batch["ids"])
+
+    def get_records(self, ids):
+        """
+        按ID读取文档（不存在的ID被忽略）
+        Returns:
+            (ID列表, 文本列表, 向量列表, 元数据列表)
+        """
+        batch = self.store._collection.get(ids=ids, include=["documents", "embeddings", "metadatas"])
+        return batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"]
+
+    def list_collections(self):
+        """
+        列出数据库中的所有集合名
+        """
+        # chromadb 0.6 起 list_collections 直接返回集合名
+        return [getattr(c, "name", c) for c in self.store._client.list_collections()]
+
+    def delete_collection(self, collection_name):
+        """
+        删除指定集合
+        """
+        self.store._client.delete_collection(collection_name)
+
+    def delete(self, ids):
+        """
+        按ID删除文档
         """
-        self.store.add_documents(documents=docs)
+        if ids:
+            self.store.delete(ids=ids)
 
     def get_store(self):
         """
@@ -0,0 +1,55 @@
+import json
+import os
+from datetime import datetime
+
+from .bm25 import lexical_index_path
+from .manifest import manifest_path
+
+# 记录当前对外提供检索的集合，与 ChromaDB 的持久化目录放在一起
+ACTIVE_FILENAME = "active_collection.json"
+# 尚未切换过集合时使用 langchain 默认集合
+DEFAULT_COLLECTION = "langchain"
+# 后台重建任务创建的集合名前缀
+BUILD_PREFIX = "kb_"
+
+
+def active_collection_path(persist_path):
+    """记录当前生效集合的文件路径，所有进程共享"""
+    return os.path.join(persist_path, ACTIVE_FILENAME)
+
+
+def active_collection(persist_path):
+    """当前生效的集合名"""
+    path = active_collection_path(persist_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("collection") or DEFAULT_COLLECTION
+    except (OSError, ValueError):
+        return DEFAULT_COLLECTION
+
+
+def set_active_collection(persist_path, collection_name):
+    """原子写入当前生效的集合名，重启后继续使用该集合"""
+    os.makedirs(persist_path, exist_ok=True)
+    path = active_collection_path(persist_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"collection": collection_name, "activated_at": datetime.now().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+def new_collection_name(avoid=()):
+    """每次重建使用新的集合，如 kb_20250615_103000；与 avoid 中的集合重名时加序号"""
+    base = BUILD_PREFIX + datetime.now().strftime("%Y%m%d_%H%M%S")
+    name, index = base, 1
+    while name in avoid:
+        name = f"{base}_{index}"
+        index += 1
+    return name
+
+
+def remove_collection_files(persist_path, collection_name):
+    """删除集合对应的词法索引和导入清单文件"""
+    for path in (lexical_index_path(persist_path, collection_name), manifest_path(persist_path, collection_name)):
+        if os.path.exists(path):
+            os.remove(path)
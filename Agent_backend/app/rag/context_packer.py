@@ -0,0 +1,136 @@
+import os
+import re
+
+from .bm25 import tokenize
+
+_CJK_PATTERN = re.compile(r"[一-鿿]")
+# 按中英文句末标点和换行切句，标点保留在句尾
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?；;\n]+[。！？!?；;\n]*")
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中文约每字1个token，其余字符约每4个1个token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def doc_score(doc):
+    """文档的排序分数，优先使用融合分数"""
+    metadata = doc.metadata
+    for key in ('rrf_score', 'score', 'bm25_score'):
+        if metadata.get(key) is not None:
+            return metadata[key]
+    return 0.0
+
+
+class ContextPacker:
+    """
+    在token预算内组装RAG上下文
+    - 按分数从高到低选取文本块；
+    - 同一来源同一页中相互重叠或相邻的文本块先合并，避免重叠部分重复占用预算；
+    - 超出单块上限或剩余预算的文本块只保留与问题最匹配的句子（保持原文顺序）。
+    """
+
+    def __init__(self, max_tokens=3000, max_chunk_tokens=800):
+        self.max_tokens = max_tokens  # 整个上下文的token预算
+        self.max_chunk_tokens = max_chunk_tokens  # 单个文本块最多占用的token数
+
+    @staticmethod
+    def _merge_neighbours(docs):
+        """
+        合并同一来源、同一页中区间重叠或相邻的文本块（依赖切分时写入的 start_index）
+        Returns:
+            [(文本, 元数据, 分数)]，按分数降序
+        """
+        groups = {}
+        singles = []
+        for doc in docs:
+            start = doc.metadata.get('start_index')
+            if start is None:
+                singles.append((doc.page_content, doc.metadata, doc_score(doc)))
+                continue
+            key = (doc.metadata.get('source'), doc.metadata.get('page'))
+            groups.setdefault(key, []).append((start, doc))
+
+        merged = []
+        for items in groups.values():
+            items.sort(key=lambda item: item[0])
+            current = None
+            for start, doc in items:
+                end = start + len(doc.page_content)
+                if current is not None and start <= current['end']:
+                    # 只追加超出已有区间的部分
+                    overlap = current['end'] - start
+                    current['text'] += doc.page_content[overlap:]
+                    current['end'] = max(current['end'], end)
+                    current['score'] = max(current['score'], doc_score(doc))
+                    continue
+                if current is not None:
+                    merged.append((current['text'], current['metadata'], current['score']))
+                current = {'text': doc.page_content, 'end': end,
+                           'metadata': doc.metadata, 'score': doc_score(doc)}
+            if current is not None:
+                merged.append((current['text'], current['metadata'], current['score']))
+
+        merged.extend(singles)
+        merged.sort(key=lambda item: item[2], reverse=True)
+        return merged
+
+    @staticmethod
+    def _trim(text, query_tokens, budget):
+        """保留与问题词元重合最多的句子，直到用完预算"""
+        sentences = [s for s in _SENTENCE_PATTERN.findall(text) if s.strip()]
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(query_tokens.intersection(tokenize(sentences[i]))), i))
+        chosen = []
+        used = 0
+        for i in ranked:
+            cost = estimate_tokens(sentences[i])
+            if used + cost > budget:
+                continue
+            chosen.append(i)
+            used += cost
+        return "".join(sentences[i] for i in sorted(chosen)).strip()
+
+    def pack(self, query, docs):
+        """
+        Returns:
+            (上下文文本, 统计信息)
+        """
+        query_tokens = set(tokenize(query or ""))
+        candidates = self._merge_neighbours(docs)
+
+        parts = []
+        sources = []
+        remaining = self.max_tokens
+        separator_tokens = estimate_tokens("\n\n")
+        for text, metadata, _ in candidates:
+            source = os.path.basename(str(metadata.get('source', '')))
+            page = metadata.get('page')
+            header = f"[{source} 第{page + 1}页]" if isinstance(page, int) else f"[{source}]"
+            # 来源标题、换行和与上一段之间的空行也计入预算
+            overhead = estimate_tokens(header) + 1 + (separator_tokens if parts else 0)
+            budget = min(self.max_chunk_tokens, remaining - overhead)
+            if budget <= 0:
+                break
+            if estimate_tokens(text) > budget:
+                text = self._trim(text, query_tokens, budget)
+            if not text:
+                continue
+            parts.append(f"{header}\n{text}")
+            sources.append(metadata.get('source', ''))
+            remaining -= overhead + estimate_tokens(text)
+
+        context = "\n\n".join(parts)
+        stats = {
+            "input_chunks": len(docs),
+            "input_tokens": sum(estimate_tokens(doc.page_content) for doc in docs),
+            "merged_chunks": len(candidates),
+            "packed_chunks": len(parts),
+            "packed_chars": len(context),
+            "packed_tokens": estimate_tokens(context),
+            "budget": self.max_tokens,
+            "sources": list(dict.fromkeys(sources)),
+        }
+        return context, stats
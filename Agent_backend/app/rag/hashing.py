@@ -0,0 +1,17 @@
+import hashlib
+
+
+def normalize_content(text):
+    """去掉空格和换行，用于内容比较"""
+    return text.replace(' ', '').replace('\n', '')
+
+
+def content_hash(text):
+    """文本块内容哈希，入库时写入 metadata['content_hash']，检索去重时直接比较"""
+    return hashlib.sha1(normalize_content(text).encode('utf-8')).hexdigest()
+
+
+def doc_content_hash(doc):
+    """优先使用入库时预先计算的哈希，旧数据没有时现场计算"""
+    metadata = getattr(doc, 'metadata', None) or {}
+    return metadata.get('content_hash') or content_hash(doc.page_content)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+
+# 清单文件名，与 ChromaDB 的持久化目录放在一起，每个集合一个（文件名沿用旧版本，内容为JSON Lines）
+MANIFEST_FILENAME = "ingestion_manifest_{collection}.json"
+# 清单文件格式版本：2 起为追加写入的日志，之前为整体写入的JSON
+MANIFEST_VERSION = 2
+_HEADER = json.dumps({"version": MANIFEST_VERSION}) + "\n"
+
+
+def manifest_path(persist_path, collection_name="langchain"):
+    """向量库集合对应的导入清单路径"""
+    return os.path.join(persist_path, MANIFEST_FILENAME.format(collection=collection_name))
+
+
+def file_hash(path, block_size=1 << 20):
+    """文件内容的sha256，分块读取避免大文件占用内存"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    知识库导入清单：记录每个已导入PDF的内容哈希、切分器版本和写入的文本块ID
+    - 大小和修改时间都没变的文件直接视为未变化，不读取内容；
+    - 内容哈希或切分器版本变化的文件需要重新导入，旧的文本块先删除；
+    - 清单中有而目录中已不存在的文件，其文本块需要删除；
+    - depends_on 记录文件中因与其他文件重复而未入库的文本块来自哪些文件，
+      这些文件删除或重新导入时，本文件也需要重新导入，避免内容从知识库中丢失。
+    清单文件是追加写入的日志：首行为版本号，之后每行记录一个文件的条目或删除，同一路径以最后一行为准；
+    保存时只追加变化的条目，失效的行过多时整体重写。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self._pending = {}  # 路径 -> 条目（None 表示删除），尚未写入文件
+        self._lines = 0  # 文件中的记录行数，None 表示需要整体重写（文件不存在或为旧版本格式）
+        if not os.path.exists(path):
+            self._lines = None
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.readline() != _HEADER:
+                # 旧版本的整体JSON
+                f.seek(0)
+                self.files = json.load(f).get("files", {})
+                self._lines = None
+                return
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # 写入中断留下的不完整行
+                record = json.loads(line)
+                if record.get("removed"):
+                    self.files.pop(record["path"], None)
+                else:
+                    self.files[record["path"]] = record["entry"]
+                self._lines += 1
+
+    def plan(self, pdf_files, chunker_version):
+        """
+        对比目录和清单
+        Returns:
+            (需要导入的文件列表, 需要删除文本块的清单条目 {路径: 条目})
+            需要导入的文件若已有旧条目，旧条目也在删除列表中
+        """
+        to_ingest = []
+        stale = {}
+        for path in pdf_files:
+            entry = self.files.get(path)
+            stat = os.stat(path)
+            if entry is not None and entry.get("chunker_version") == chunker_version:
+                if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+                    continue
+                # 修改时间变了但内容没变（如重新复制），只刷新清单
+                digest = file_hash(path)
+                if digest == entry.get("hash"):
+                    entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    self._pending[path] = entry
+                    continue
+            to_ingest.append(path)
+            if entry is not None:
+                stale[path] = entry
+
+        current = set(pdf_files)
+        for path, entry in self.files.items():
+            if path not in current:
+                stale[path] = entry
+
+        # 依赖被删除或重新导入的文件的，也要重新导入（传递生效）
+        for path, entry in self.dependents(stale).items():
+            stale[path] = entry
+            to_ingest.append(path)
+        to_ingest.sort()
+        return to_ingest, stale
+
+    def dependents(self, paths):
+        """直接或间接依赖 paths 中文件的清单条目 {路径: 条目}（不含 paths 本身）"""
+        affected = set(paths)
+        result = {}
+        changed = True
+        while changed:
+            changed = False
+            for path, entry in self.files.items():
+                if path in affected:
+                    continue
+                if affected.intersection(entry.get("depends_on", ())):
+                    affected.add(path)
+                    result[path] = entry
+                    changed = True
+        return result
+
+    def known_hashes(self):
+        """已入库文本块的 {内容哈希: 来源文件}"""
+        return {digest: path for path, entry in self.files.items()
+                for digest in entry.get("content_hashes", [])}
+
+    def record(self, path, chunker_version, chunk_ids, content_hashes, depends_on=()):
+        """记录一个文件导入后写入的文本块，以及其重复内容所在的文件"""
+        stat = os.stat(path)
+        self.files[path] = self._pending[path] = {
+            "hash": file_hash(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunker_version": chunker_version,
+            "chunk_ids": chunk_ids,
+            "content_hashes": content_hashes,
+            "depends_on": list(depends_on),
+        }
+
+    def forget(self, path):
+        if self.files.pop(path, None) is not None:
+            self._pending[path] = None
+
+    def save(self):
+        """追加写入变化的条目；文件不存在、为旧版本格式或失效的行超过一半时整体重写"""
+        if self._lines is None or self._lines + len(self._pending) > 2 * len(self.files) + 100:
+            self.compact()
+            return
+        if not self._pending:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for path, entry in self._pending.items():
+                record = {"path": path, "removed": True} if entry is None else {"path": path, "entry": entry}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._lines += len(self._pending)
+        self._pending.clear()
+
+    def compact(self):
+        """原子地重写清单文件，每个文件一行"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_HEADER)
+            for path, entry in self.files.items():
+                f.write(json.dumps({"path": path, "entry": entry}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self.files)
+        self._pending.clear()
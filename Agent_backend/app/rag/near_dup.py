@@ -0,0 +1,174 @@
+import zlib
+from collections import deque
+
+import numpy as np
+
+from .context_packer import estimate_tokens
+from .hashing import content_hash, normalize_content
+
+# 大于 2^32 的素数，保证 a * h + b 在 uint64 范围内不溢出
+_PRIME = np.uint64(4294967311)
+
+
+def _choose_bands(num_perm, threshold):
+    """选择 LSH 的分段数 b 和每段行数 r，使 S 曲线的拐点 (1/b)^(1/r) 最接近阈值"""
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    """
+    基于 MinHash + LSH 的近似重复文本块过滤
+    - 文本按字符 shingle_size-gram 切片，计算 num_perm 维 MinHash 签名；
+    - 签名分段后放入 LSH 桶，只与落入同一桶的文本块比较，避免两两比较；
+    - 估计的 Jaccard 相似度不低于 threshold 的文本块视为重复，保留先出现的那个；
+    - 只保留最近 max_entries 个文本块的签名（每个约 num_perm * 8 字节），更早的文本块不再参与比较，
+      近似重复大多出现在同一文件或相邻文件中，窗口外的漏判只会多保留少量文本块。
+    哈希函数使用固定种子，相同输入的过滤结果是确定的。
+    """
+
+    def __init__(self, threshold=0.85, num_perm=64, shingle_size=5, seed=1, max_entries=100000):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.max_entries = max_entries
+        self._buckets = [{} for _ in range(self.bands)]
+        self._entries = {}  # 序号 -> (签名, 来源, 各段的桶键)
+        self._order = deque()  # 按加入顺序排列的序号，超出窗口时淘汰最早的
+        self._next_idx = 0
+
+    def signature(self, text):
+        text = normalize_content(text)
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def is_duplicate(self, text):
+        """与已保留的文本块近似重复时返回 True，否则记录该文本块并返回 False"""
+        return self.find_duplicate(text)[0]
+
+    def find_duplicate(self, text, owner=None):
+        """
+        与已保留的文本块近似重复时返回 (True, 该文本块的 owner)，
+        否则以 owner 记录该文本块并返回 (False, None)
+        """
+        signature = self.signature(text)
+        keys = self._band_keys(signature)
+        candidates = set()
+        for bucket, key in zip(self._buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        for idx in sorted(candidates):
+            candidate, candidate_owner, _ = self._entries[idx]
+            if np.mean(candidate == signature) >= self.threshold:
+                return True, candidate_owner
+
+        idx = self._next_idx
+        self._next_idx += 1
+        self._entries[idx] = (signature, owner, keys)
+        self._order.append(idx)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(idx)
+        while len(self._order) > self.max_entries:
+            self._evict(self._order.popleft())
+        return False, None
+
+    def discard(self, owner):
+        """删除某个 owner 记录的全部文本块（如解析失败、已写入的文本块被撤回的文件）"""
+        removed = [idx for idx, (_, entry_owner, _) in self._entries.items() if entry_owner == owner]
+        for idx in removed:
+            self._evict(idx)
+            self._order.remove(idx)
+
+    def _evict(self, idx):
+        _, _, keys = self._entries.pop(idx)
+        for bucket, key in zip(self._buckets, keys):
+            members = bucket[key]
+            members.remove(idx)
+            if not members:
+                del bucket[key]
+
+
+class ChunkDeduplicator:
+    """
+    文本块去重：先按标准化内容的哈希精确去重，再用 MinHash 过滤近似重复（图表描述不参与）
+    状态在整次导入中保留，跨文件生效；通过的文本块会写入 metadata['content_hash']
+    被过滤的文本块记录其重复的是哪个文件（来源）中的内容，该文件删除或变化时需要重新导入本文件。
+    精确去重保存所有已见文本块的内容哈希（每个几十字节），近似去重只保存最近一批文本块的签名。
+    """
+
+    def __init__(self, near_dup_threshold=0.85, known=None):
+        """
+        Args:
+            known: 已入库文本块的 {内容哈希: 来源}，与其内容相同的文本块直接过滤
+        """
+        self.seen = dict(known or {})  # 内容哈希 -> 来源
+        self.dependencies = {}  # 来源 -> 其被过滤的文本块所重复的来源集合
+        self.near_dup_threshold = near_dup_threshold
+        self.near_dup_filter = NearDuplicateFilter(threshold=near_dup_threshold) \
+            if near_dup_threshold is not None else None
+        self.stats = {"chunks": 0, "kept": 0, "exact_duplicates": 0,
+                      "near_duplicates": 0, "near_duplicate_tokens": 0}
+
+    def accept(self, chunk):
+        """文本块需要保留时返回 True"""
+        self.stats["chunks"] += 1
+        source = chunk.metadata.get('source')
+        # 使用更严格的内容比较
+        digest = content_hash(chunk.page_content.strip())
+        if digest in self.seen:
+            self.stats["exact_duplicates"] += 1
+            self._depend(source, self.seen[digest])
+            return False
+        self.seen[digest] = source
+        chunk.metadata['content_hash'] = digest
+
+        if self.near_dup_filter is not None and chunk.metadata.get('type') != 'chart':
+            duplicate, owner = self.near_dup_filter.find_duplicate(chunk.page_content, source)
+            if duplicate:
+                self.stats["near_duplicates"] += 1
+                self.stats["near_duplicate_tokens"] += estimate_tokens(chunk.page_content)
+                self._depend(source, owner)
+                return False
+        self.stats["kept"] += 1
+        return True
+
+    def _depend(self, source, owner):
+        if owner is not None and owner != source:
+            self.dependencies.setdefault(source, set()).add(owner)
+
+    def discard(self, source):
+        """
+        撤回某个来源的全部文本块（如解析到一半失败的文件），之后的文本块不再与它们比较去重，
+        去重结果与该文件从未出现过时相同
+        """
+        self.seen = {digest: owner for digest, owner in self.seen.items() if owner != source}
+        if self.near_dup_filter is not None:
+            self.near_dup_filter.discard(source)
+        self.dependencies.pop(source, None)
+
+    def pop_dependencies(self, source):
+        """取出某个来源被过滤的文本块所重复的来源列表"""
+        return sorted(self.dependencies.pop(source, ()))
+
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['chunks']} chunks split, {stats['kept']} kept, "
+                f"{stats['exact_duplicates']} exact duplicates, "
+                f"{stats['near_duplicates']} near duplicates (threshold {self.near_dup_threshold}, "
+                f"about {stats['near_duplicate_tokens']} tokens saved)")
@@ -1,34 +1,66 @@
 import os
 import logging
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from .bm25 import BM25Index, lexical_index_path
 from .chroma_conn import ChromaDB
-import pdfplumber
-from PIL import Image
-import io
+from .collection_registry import active_collection
+from .context_packer import estimate_tokens
+from .hashing import content_hash
+from .manifest import IngestionManifest, manifest_path
+from .near_dup import ChunkDeduplicator
+from .rate_limiter import AdaptiveRateLimiter
+import fitz  # PyMuPDF
 from langchain.schema import Document
 
 
 class PDFProcessor:
+    # 切分逻辑变化时递增，清单中版本不同的文件会重新导入
+    CHUNKER_VERSION = "1"
+
     def __init__(self,
                  directory,  # PDF文件所在目录
                  chroma_server_type,  # ChromaDB服务器类型
                  persist_path,  # ChromaDB持久化路径
-                 embed):  # 向量化函数
+                 embed,  # 向量化函数
+                 parse_workers=None,  # 解析PDF的进程数，默认为CPU核数，1 表示在主进程中逐个解析
+                 collection_name=None):  # 写入的集合，默认为当前生效的集合
 
         self.directory = directory
-        self.file_group_num = 40  # 减少每组处理的文件数，提高处理质量
-        self.batch_num = 4  # 减少批次数量，提高稳定性
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.file_group_num = 40  # 每导入多少个文件保存一次词法索引和导入清单
+        self.queue_size = 200  # 切分阶段与向量化阶段之间最多缓存的文本块数
+        self.embed_batch_size = 10  # 每次向量化请求的文本数（text-embedding-v3 单次最多10条）
+        self.embed_concurrency = 4  # 同时进行的向量化请求数
+        self.embed_rate = 5  # 每秒最多发起的向量化请求数，被限流时自动降低
+        self.embed_retries = 3  # 单批向量化失败后的重试次数
+        self.write_batch_size = 500  # 每次写入ChromaDB的文本块数
 
         self.chunksize = 4000  # 增加文本块大小
         self.overlap = 1000  # 增加重叠大小
+        self.near_dup_threshold = 0.85  # 近似重复文本块的 MinHash 相似度阈值，None 表示不过滤
         self.max_chart_size = 1024  # 图表最大尺寸
 
+        self.embed = embed
+        self.chroma_server_type = chroma_server_type
+        self.persist_path = persist_path
+        self.collection_name = collection_name or active_collection(persist_path)
         self.chroma_db = ChromaDB(chroma_server_type=chroma_server_type,
                                   persist_path=persist_path,
+                                  collection_name=self.collection_name,
                                   embed=embed)
+        # BM25词法索引与向量库写入同一批文本块，持久化在向量库目录下；导入时只追加写入，不加载已有内容
+        self.lexical_index = BM25Index(lexical_index_path(persist_path, self.collection_name), load=False)
+        # 导入清单，只导入新增或变化的文件
+        self.manifest = IngestionManifest(manifest_path(persist_path, self.collection_name))
+        # 导入进度，供后台任务查询
+        self.progress = {"stage": "pending", "files_total": 0, "files_done": 0,
+                         "chunks": 0, "tokens": 0, "chunks_per_s": 0.0, "tokens_per_s": 0.0}
         # 配置日志
         logging.basicConfig(
             level=logging.INFO,
@@ -36,36 +68,6 @@ class PDFProcessor:
             datefmt='%Y-%m-%d %H:%M:%S'
         )
 
-    def extract_charts(self, pdf_path):
-        """
-        提取PDF中的图表信息
-        """
-        charts_info = []
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    # 提取图表
-                    images = page.images
-                    for img in images:
-                        try:
-                            # 获取图表位置和大小
-                            bbox = img.get('bbox', [0, 0, page.width, page.height])
-                            # 将bbox转换为字符串格式
-                            bbox_str = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
-                            # 提取图表描述
-                            chart_text = f"图表位于第{page_num + 1}页，位置：{bbox_str}"
-                            charts_info.append({
-                                'text': chart_text,
-                                'page': page_num + 1,
-                                'position': bbox_str  # 使用字符串格式的位置信息
-                            })
-                        except Exception as e:
-                            logging.warning(f"处理第{page_num + 1}页的图表时出错: {str(e)}")
-                            continue
-        except Exception as e:
-            logging.error(f"提取图表时出错: {str(e)}")
-        return charts_info
-
     def load_pdf_files(self):
         """
         加载目录下的所有PDF文件
@@ -74,42 +76,80 @@ class PDFProcessor:
         for file in os.listdir(self.directory):
             if file.lower().endswith('.pdf'):
                 pdf_files.append(os.path.join(self.directory, file))
+        # 固定文件顺序，保证入库结果与目录遍历顺序和进程数无关
+        pdf_files.sort()
 
         logging.info(f"Found {len(pdf_files)} PDF files.")
         return pdf_files
 
-    def load_pdf_content(self, pdf_path):
+    @staticmethod
+    def load_pdf_content(pdf_path):
         """
-        读取PDF文件内容，包括文本和图表
+        读取PDF文件内容，包括文本和图表（不依赖实例状态，可在子进程中执行）
         """
-        # 加载文本内容
-        pdf_loader = PyMuPDFLoader(file_path=pdf_path)
-        docs = pdf_loader.load()
-
-        # 提取图表信息
-        charts_info = self.extract_charts(pdf_path)
-
-        # 将图表信息添加到文档中
-        for chart in charts_info:
-            docs.append({
-                'page_content': chart['text'],
-                'metadata': {
-                    'source': pdf_path,
-                    'page': chart['page'],
-                    'type': 'chart',
-                    'position': chart['position']
-                }
-            })
-
-        logging.info(f"Loading content from {pdf_path}, including {len(charts_info)} charts.")
+        docs, _ = PDFProcessor.extract_pdf(pdf_path)
         return docs
 
-    def split_text(self, documents):
+    @staticmethod
+    def extract_pdf(pdf_path):
         """
-        优化文本分块策略
+        一次性读取整个PDF
+        Returns:
+            (文档列表, 每页耗时秒数列表)
         """
+        page_timings = []
+        docs = list(PDFProcessor.iter_pdf_documents(pdf_path, page_timings))
+        return docs, page_timings
+
+    @staticmethod
+    def iter_pdf_documents(pdf_path, page_timings=None):
+        """
+        只打开一次PDF，逐页惰性提取文本、图片/图表区域和页面元数据
+        文本和图表都是 Document，页码 page 从0开始；图表的 type 为 chart
+        Args:
+            page_timings: 传入列表时追加每页的解析耗时（秒）
+        """
+        charts = 0
+        with fitz.open(pdf_path) as pdf:
+            # 与 PyMuPDFLoader 相同的文件级元数据
+            file_metadata = {
+                'source': pdf_path,
+                'file_path': pdf_path,
+                'total_pages': len(pdf),
+                **{k: v for k, v in (pdf.metadata or {}).items() if isinstance(v, (str, int))},
+            }
+            for page in pdf:
+                page_start = time.time()
+                page_metadata = dict(file_metadata, page=page.number)
+                page_docs = []
+
+                text = page.get_text()
+                if text.strip():
+                    page_docs.append(Document(page_content=text, metadata=page_metadata))
+
+                for img in page.get_image_info():
+                    try:
+                        # 获取图表位置，转换为字符串格式
+                        bbox = img.get('bbox') or tuple(page.rect)
+                        bbox_str = ",".join(f"{v:.1f}" for v in bbox)
+                        page_docs.append(Document(
+                            page_content=f"图表位于第{page.number + 1}页，位置：{bbox_str}",
+                            metadata=dict(page_metadata, type='chart', position=bbox_str)
+                        ))
+                        charts += 1
+                    except Exception as e:
+                        logging.warning(f"处理第{page.number + 1}页的图表时出错: {str(e)}")
+                        continue
+
+                if page_timings is not None:
+                    page_timings.append(time.time() - page_start)
+                yield from page_docs
+
+        logging.info(f"Loading content from {pdf_path}, including {charts} charts.")
+
+    def _text_splitter(self):
         # 使用更智能的分块器
-        text_splitter = RecursiveCharacterTextSplitter(
+        return RecursiveCharacterTextSplitter(
             chunk_size=self.chunksize,
             chunk_overlap=self.overlap,
             length_function=len,
@@ -118,119 +158,426 @@ class PDFProcessor:
             keep_separator=True  # 保留分隔符
         )
 
-        # 对每个文档进行分块
-        all_chunks = []
+    def iter_chunks(self, documents, deduplicator):
+        """
+        逐个文档切分并去重，惰性产出文本块
+        图表描述很短，直接作为一个文本块
+        """
+        text_splitter = self._text_splitter()
         for doc in documents:
-            # 处理文档对象
-            if isinstance(doc, dict):
-                # 如果是图表，直接添加
-                if doc.get('type') == 'chart':
-                    all_chunks.append(doc)
-                    continue
-
-                # 对文本进行分块
-                doc_obj = Document(
-                    page_content=doc.get('page_content', ''),
-                    metadata=doc.get('metadata', {})
-                )
-                chunks = text_splitter.split_documents([doc_obj])
-
-                # 添加文档来源信息
-                for chunk in chunks:
-                    chunk.metadata.update({
-                        'source': doc.get('source', ''),
-                        'page': doc.get('page', 0)
-                    })
-
-                all_chunks.extend(chunks)
+            if doc.metadata.get('type') == 'chart':
+                chunks = [doc]
             else:
-                # 处理langchain Document对象
-                if hasattr(doc, 'metadata') and doc.metadata.get('type') == 'chart':
-                    all_chunks.append(doc)
-                    continue
-
                 chunks = text_splitter.split_documents([doc])
-                all_chunks.extend(chunks)
-
-        # 优化去重逻辑
-        unique_chunks = []
-        seen_content = set()
-        for chunk in all_chunks:
-            if isinstance(chunk, dict):
-                content = chunk.get('page_content', '').strip()
-            else:
-                content = chunk.page_content.strip()
-
-            # 使用更严格的内容比较
-            normalized_content = content.replace(' ', '').replace('\n', '')
-            if normalized_content not in seen_content:
-                seen_content.add(normalized_content)
-                unique_chunks.append(chunk)
+            for chunk in chunks:
+                if deduplicator.accept(chunk):
+                    yield chunk
 
-        logging.info(f"Split text into {len(unique_chunks)} unique chunks with optimized strategy.")
+    def split_text(self, documents):
+        """
+        优化文本分块策略：切分后按内容哈希精确去重，再过滤近似重复
+        """
+        deduplicator = ChunkDeduplicator(self.near_dup_threshold)
+        unique_chunks = list(self.iter_chunks(documents, deduplicator))
+        logging.info(f"Split text into {len(unique_chunks)} unique chunks: {deduplicator.summary()}.")
         return unique_chunks
 
-    def insert_docs_chromadb(self, docs, batch_size=6):
+    @property
+    def chunker_version(self):
+        """切分器版本，包含分块大小、重叠大小和近似去重阈值"""
+        return f"{self.CHUNKER_VERSION}:{self.chunksize}:{self.overlap}:{self.near_dup_threshold}"
+
+    @staticmethod
+    def chunk_id(doc):
+        """文本块ID：来源文件 + 内容哈希，同一内容重复导入时ID不变"""
+        return content_hash(f"{doc.metadata.get('source', '')}:{doc.metadata['content_hash']}")
+
+    def _embed_batch(self, texts, limiter):
+        """在速率限制下向量化一批文本，失败时退避重试"""
+        for attempt in range(self.embed_retries + 1):
+            limiter.acquire()
+            try:
+                vectors = self.embed.embed_documents(texts)
+                limiter.reward()
+                return vectors
+            except Exception as e:
+                limiter.penalize()
+                if attempt == self.embed_retries:
+                    raise
+                logging.warning(f"向量化请求失败（第{attempt + 1}次），速率降为 {limiter.rate:.2f}/s: {str(e)}")
+                time.sleep(2 ** attempt)
+
+    def _embed_and_write(self, items):
         """
-        将文档插入到ChromaDB
+        流水线的向量化和写入阶段
+        按 embed_batch_size 分批并发向量化（受速率限制），同时在途的批次不超过 2 * embed_concurrency，
+        按提交顺序取回结果，攒够 write_batch_size 条（或全部结束时）批量写入ChromaDB和词法索引；
+        读到 _FileDone 标记时，该文件的文本块都已向量化，但可能还在写入缓冲中，
+        等下一次写入完成后再记入清单，每记入 file_group_num 个文件保存一次；
+        解析失败的文件不记入清单（下次重试），已写入的文本块删除，
+        因此单进程流式解析（失败前的页已产出）与多进程整体解析（失败时没有文本块）的结果相同
+        Args:
+            items: 文本块和 _FileDone 标记组成的迭代器
+        """
+        start_time = time.time()
+        limiter = AdaptiveRateLimiter(self.embed_rate)
+        max_inflight = self.embed_concurrency * 2
+        inflight = deque()  # (future, 文本块列表) 或 _FileDone，按提交顺序排列
+        batch = []
+        write_buffer = []  # (文本块, 向量)
+        file_chunks = {}  # 路径 -> (文本块ID列表, 内容哈希列表)，尚未记入清单
+        sealed = []  # 文本块已全部向量化、等待写入完成后记入清单的 _FileDone
+        counters = {"chunks": 0, "tokens": 0, "files": 0}
+
+        def write():
+            if write_buffer:
+                flush()
+            # 缓冲已清空，已结束的文件的文本块都已写入，可以记入清单
+            for done in sealed:
+                chunk_ids, content_hashes = file_chunks.pop(done.path, ([], []))
+                if done.timing.get("error") is None:
+                    self.manifest.record(done.path, self.chunker_version, chunk_ids, content_hashes,
+                                         done.depends_on)
+                elif chunk_ids:
+                    # 解析失败的文件不记入清单，下次重试；撤回失败前已写入的文本块，避免成为清单之外的孤立数据
+                    self.chroma_db.delete(chunk_ids)
+                    self.lexical_index.remove(chunk_ids)
+                counters["files"] += 1
+                if counters["files"] % self.file_group_num == 0:
+                    self.save_indexes()
+            sealed.clear()
+
+        def flush():
+            chunks = [chunk for chunk, _ in write_buffer]
+            ids = [self.chunk_id(chunk) for chunk in chunks]
+            self.chroma_db.add_embeddings(
+                ids=ids,
+                texts=[chunk.page_content for chunk in chunks],
+                embeddings=[vector for _, vector in write_buffer],
+                metadatas=[chunk.metadata for chunk in chunks])
+            # 同步更新词法索引
+            self.lexical_index.add_documents(chunks, ids)
+            for chunk, doc_id in zip(chunks, ids):
+                entry = file_chunks.setdefault(chunk.metadata.get('source'), ([], []))
+                entry[0].append(doc_id)
+                entry[1].append(chunk.metadata['content_hash'])
+            write_buffer.clear()
+
+        def complete(entry, pbar):
+            if isinstance(entry, _FileDone):
+                log_parse_timing(entry.path, entry.timing)
+                sealed.append(entry)
+                self.progress["files_done"] += 1
+                return
+
+            future, chunks = entry
+            write_buffer.extend(zip(chunks, future.result()))
+            if len(write_buffer) >= self.write_batch_size:
+                write()
+
+            # 实时显示吞吐量
+            batch_tokens = sum(estimate_tokens(chunk.page_content) for chunk in chunks)
+            counters["chunks"] += len(chunks)
+            counters["tokens"] += batch_tokens
+            self.progress["chunks"] += len(chunks)
+            self.progress["tokens"] += batch_tokens
+            elapsed_time = time.time() - start_time
+            if elapsed_time > 0:  # 防止除以零
+                self.progress["chunks_per_s"] = round(counters["chunks"] / elapsed_time, 2)
+                self.progress["tokens_per_s"] = round(counters["tokens"] / elapsed_time)
+                pbar.set_postfix({"chunks/s": f"{counters['chunks'] / elapsed_time:.2f}",
+                                  "tokens/s": f"{counters['tokens'] / elapsed_time:.0f}",
+                                  "rate": f"{limiter.rate:.2f}/s"})
+            pbar.update(len(chunks))
+
+        with ThreadPoolExecutor(max_workers=self.embed_concurrency) as pool, \
+                tqdm(desc="Inserting chunks", unit="chunk") as pbar:
+
+            def submit():
+                texts = [chunk.page_content for chunk in batch]
+                inflight.append((pool.submit(self._embed_batch, texts, limiter), list(batch)))
+                batch.clear()
+
+            for item in items:
+                if isinstance(item, _FileDone):
+                    # 文件结束，提交剩余的文本块，标记排在它们之后
+                    if batch:
+                        submit()
+                    inflight.append(item)
+                else:
+                    batch.append(item)
+                    if len(batch) >= self.embed_batch_size:
+                        submit()
+                # 在途批次过多时等待最早的批次完成（背压）
+                while len(inflight) > max_inflight:
+                    complete(inflight.popleft(), pbar)
+
+            if batch:
+                submit()
+            while inflight:
+                complete(inflight.popleft(), pbar)
+            write()
+
+        elapsed_time = time.time() - start_time
+        logging.info(f"Inserted {counters['chunks']} chunks ({counters['tokens']} tokens) in {elapsed_time:.2f}s, "
+                     f"{counters['chunks'] / max(elapsed_time, 1e-6):.2f} chunks/s, "
+                     f"{counters['tokens'] / max(elapsed_time, 1e-6):.0f} tokens/s.")
+        return counters["chunks"]
+
+    def insert_docs_chromadb(self, docs):
+        """
+        将已切分的文档插入到ChromaDB（文档需带有 content_hash，如 split_text 的结果）
         """
-        # 分批入库
         logging.info(f"Inserting {len(docs)} documents into ChromaDB.")
+        self._embed_and_write(iter(docs))
+        self.save_indexes(compact=True)
 
-        # 记录开始时间
-        start_time = time.time()
-        total_docs_inserted = 0
+    def save_indexes(self, compact=False):
+        """
+        持久化词法索引和导入清单（先索引后清单，清单中的文件一定已在索引中）
+        两者都只追加本次的变化；compact=True 时（导入结束）去掉词法索引中已删除的行
+        """
+        if compact:
+            self.lexical_index.compact()
+        else:
+            self.lexical_index.save()
+        self.manifest.save()
+
+    def iter_parsed_pdfs(self, pdf_files):
+        """
+        解析PDF文件，逐个产出 (路径, 文档迭代器, 耗时统计)
+        - 单进程时按页惰性读取，耗时统计在文档迭代完后才完整；
+        - 多进程时每个文件在子进程中整体解析，同时解析中的文件不超过 2 * parse_workers 个，
+          结果按输入顺序返回，因此切分和入库的顺序与进程数无关。
+        """
+        if self.parse_workers <= 1 or len(pdf_files) <= 1:
+            for pdf_path in pdf_files:
+                documents, timing = stream_pdf(pdf_path)
+                yield pdf_path, documents, timing
+            return
+
+        workers = min(self.parse_workers, len(pdf_files))
+        logging.info(f"Parsing {len(pdf_files)} PDF files with {workers} worker processes.")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for pdf_path in pdf_files:
+                pending.append(pool.submit(parse_pdf, pdf_path))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _produce_chunks(self, pdf_files, out_queue, stop, known_hashes):
+        """
+        流水线的解析和切分阶段（在后台线程中运行）
+        逐文件解析、切分、去重，文本块放入有界队列，每个文件结束后放入 _FileDone 标记，最后放入 None
+        Args:
+            known_hashes: 已入库文本块的 {内容哈希: 来源}，内容相同的文本块不再重复入库
+        """
+        def put(item):
+            # 队列满时阻塞等待（背压），下游出错退出后不再等待
+            while not stop.is_set():
+                try:
+                    out_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        deduplicator = ChunkDeduplicator(self.near_dup_threshold, known=known_hashes)
+        try:
+            for pdf_path, documents, timing in self.iter_parsed_pdfs(pdf_files):
+                for chunk in self.iter_chunks(documents, deduplicator):
+                    put(chunk)
+                    if stop.is_set():
+                        return
+                if timing.get("error") is not None:
+                    # 解析到一半失败的文件，已产出的文本块会在写入阶段撤回，去重状态也一并撤回
+                    deduplicator.discard(pdf_path)
+                put(_FileDone(pdf_path, timing, deduplicator.pop_dependencies(pdf_path)))
+            logging.info(f"Split finished: {deduplicator.summary()}.")
+        except Exception as e:
+            put(_PipelineError(e))
+        finally:
+            put(None)
+
+    def run_pipeline(self, pdf_files):
+        """
+        流式导入：解析/切分 -> 有界队列 -> 向量化/写入
+        文本块正文只保留在有界队列、在途批次和写入缓冲中，词法索引只追加写入、不加载已有内容，
+        因此正文占用的内存与语料规模无关；随语料增长的只有每个文本块的ID和内容哈希（导入清单、精确去重），
+        近似去重的签名限制在最近 NearDuplicateFilter.max_entries 个文本块内。
+        """
+        out_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        # 清单在写入阶段会被更新，先在主线程中取出已入库内容的快照
+        known_hashes = self.manifest.known_hashes()
+        producer = threading.Thread(target=self._produce_chunks, args=(pdf_files, out_queue, stop, known_hashes),
+                                    name="pdf-parser", daemon=True)
+        producer.start()
+
+        def items():
+            while True:
+                item = out_queue.get()
+                if item is None:
+                    return
+                if isinstance(item, _PipelineError):
+                    raise item.error
+                yield item
 
-        # 计算总批次
-        total_batches = (len(docs) + batch_size - 1) // batch_size
+        try:
+            self._embed_and_write(items())
+        finally:
+            stop.set()
+            producer.join()
+            self.save_indexes(compact=True)
+
+    def remove_stale(self, stale):
+        """删除已移除或已替换文件（及依赖它们的文件）的文本块，并从清单中去掉"""
+        chunk_ids = [doc_id for entry in stale.values() for doc_id in entry.get("chunk_ids", [])]
+        logging.info(f"Removing {len(chunk_ids)} chunks of {len(stale)} removed, changed or dependent files.")
+        for i in range(0, len(chunk_ids), 500):
+            self.chroma_db.delete(chunk_ids[i:i + 500])
+        self.lexical_index.remove(chunk_ids)
+        for path in stale:
+            self.manifest.forget(path)
+        self.save_indexes()
+
+    def rebuild_lexical_index(self):
+        """从向量库中的文本块重建词法索引（旧版本以内容哈希为键的索引无法按文本块ID删除）"""
+        self.lexical_index.clear()
+        count = 0
+        for ids, texts, _, metadatas in self.chroma_db.iter_records():
+            docs = [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+            self.lexical_index.add_documents(docs, ids)
+            # 逐批追加写入，不在内存中累积
+            self.lexical_index.save()
+            count += len(ids)
+        logging.info(f"Rebuilt lexical index from the vector store: {count} chunks.")
+
+    def seed_from(self, collection_name, batch_size=500):
+        """
+        从另一个集合（通常是当前生效的集合）复制导入清单，以及清单中文件的文本块、向量和词法索引，
+        之后的 process_pdfs 只需处理新增、变化和删除的文件，未变化的文件不再解析和向量化。
+        来源集合没有导入清单时（如旧版本导入的集合）不复制，新集合完整导入。
+        """
+        source = IngestionManifest(manifest_path(self.persist_path, collection_name))
+        if not source.files:
+            logging.info(f"Collection {collection_name} has no manifest, building from scratch.")
+            return
+        self.progress["stage"] = "seeding"
+        source_db = ChromaDB(chroma_server_type=self.chroma_server_type,
+                             persist_path=self.persist_path,
+                             collection_name=collection_name,
+                             embed=self.embed)
+        chunk_ids = [doc_id for entry in source.files.values() for doc_id in entry.get("chunk_ids", [])]
+        self.lexical_index.clear()
+        copied = 0
+        for i in range(0, len(chunk_ids), batch_size):
+            ids, texts, embeddings, metadatas = source_db.get_records(chunk_ids[i:i + batch_size])
+            if not ids:
+                continue
+            self.chroma_db.add_embeddings(ids=ids, texts=texts, embeddings=embeddings, metadatas=metadatas)
+            docs = [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+            self.lexical_index.add_documents(docs, ids)
+            self.lexical_index.save()
+            copied += len(ids)
+        # 先索引后清单，清单中的文件一定已在新集合中
+        self.lexical_index.save()
+        self.manifest.files = dict(source.files)
+        self.manifest.compact()
+        logging.info(f"Seeded from collection {collection_name}: {len(source.files)} files, {copied} chunks.")
 
-        with tqdm(total=total_batches, desc="Inserting batches", unit="batch") as pbar:
-            for i in range(0, len(docs), batch_size):
-                # 获取当前批次的样本
-                batch = docs[i:i + batch_size]
+    def process_pdfs_group(self, pdf_files_group):
+        self.run_pipeline(pdf_files_group)
 
-                # 将样本入库
-                self.chroma_db.add_with_langchain(batch)
-                # self.chroma_db.async_add_with_langchain(batch)
+    def process_pdfs(self):
+        """增量导入：只解析和向量化新增或变化的PDF，删除已移除或已替换文件的文本块"""
+        start_time = time.time()
+        # 获取目录下所有的PDF文件
+        pdf_files = self.load_pdf_files()
+        if self.lexical_index.legacy:
+            self.rebuild_lexical_index()
 
-                # 更新已插入的文档数量
-                total_docs_inserted += len(batch)
+        to_ingest, stale = self.manifest.plan(pdf_files, self.chunker_version)
+        logging.info(f"{len(to_ingest)} new or changed PDF files, "
+                     f"{len(pdf_files) - len(to_ingest)} unchanged, {len(stale)} to clean up.")
+        self.progress["files_total"] = len(to_ingest)
+        if stale:
+            self.progress["stage"] = "cleanup"
+            self.remove_stale(stale)
 
-                # 计算并显示当前的TPM
-                elapsed_time = time.time() - start_time  # 计算已用时间（秒）
-                if elapsed_time > 0:  # 防止除以零
-                    tpm = (total_docs_inserted / elapsed_time) * 60  # 转换为每分钟插入的文档数
-                    pbar.set_postfix({"TPM": f"{tpm:.2f}"})  # 更新进度条的后缀信息
+        if to_ingest:
+            self.progress["stage"] = "ingesting"
+            self.run_pipeline(to_ingest)
+        else:
+            # 可能刷新了修改时间；只有删除时压缩词法索引
+            self.save_indexes(compact=bool(stale))
+        self.progress["stage"] = "done"
 
-                # 更新进度条
-                pbar.update(1)
+        print(f"PDFs processed successfully in {time.time() - start_time:.3f}s!")
 
-    def process_pdfs_group(self, pdf_files_group):
-        # 读取PDF文件内容
-        pdf_contents = []
 
-        for pdf_path in pdf_files_group:
-            # 读取PDF文件内容
-            documents = self.load_pdf_content(pdf_path)
+class _FileDone:
+    """流水线中的文件结束标记，depends_on 为该文件中重复内容所在的其他文件"""
 
-            # 将documents 逐一添加到pdf_contents
-            pdf_contents.extend(documents)
+    def __init__(self, path, timing, depends_on=()):
+        self.path = path
+        self.timing = timing
+        self.depends_on = depends_on
 
-        # 将文本切分成小段
-        docs = self.split_text(pdf_contents)
 
-        # 将文档插入到ChromaDB
-        self.insert_docs_chromadb(docs, self.batch_num)
+class _PipelineError:
+    """解析线程中的异常，传给主线程重新抛出"""
 
-    def process_pdfs(self):
-        # 获取目录下所有的PDF文件
-        pdf_files = self.load_pdf_files()
+    def __init__(self, error):
+        self.error = error
 
-        group_num = self.file_group_num
 
-        # group_num 个PDF文件为一组，分批处理
-        for i in range(0, len(pdf_files), group_num):
-            pdf_files_group = pdf_files[i:i + group_num]
-            self.process_pdfs_group(pdf_files_group)
+def stream_pdf(pdf_path):
+    """
+    在主进程中按页惰性解析PDF
+    Returns:
+        (文档迭代器, 耗时统计)，耗时统计在迭代完后才完整，elapsed 为各页解析耗时之和
+    """
+    timing = {"elapsed": 0.0, "pages": [], "error": None}
 
-        print("PDFs processed successfully!")
\ No newline at end of file
+    def documents():
+        try:
+            yield from PDFProcessor.iter_pdf_documents(pdf_path, timing["pages"])
+        except Exception as e:
+            logging.error(f"解析PDF文件 {pdf_path} 时出错: {str(e)}")
+            timing["error"] = str(e)
+        finally:
+            timing["elapsed"] = sum(timing["pages"])
+
+    return documents(), timing
+
+
+def parse_pdf(pdf_path):
+    """
+    子进程入口：解析单个PDF
+    Returns:
+        (路径, 文档列表, {"elapsed": 总耗时秒数, "pages": [每页耗时秒数], "error": 错误信息})
+        解析失败时文档列表为空
+    """
+    start_time = time.time()
+    error = None
+    try:
+        documents, page_timings = PDFProcessor.extract_pdf(pdf_path)
+    except Exception as e:
+        logging.error(f"解析PDF文件 {pdf_path} 时出错: {str(e)}")
+        documents, page_timings, error = [], [], str(e)
+    return pdf_path, documents, {"elapsed": time.time() - start_time, "pages": page_timings, "error": error}
+
+
+def log_parse_timing(pdf_path, timing):
+    """输出单个PDF的解析耗时明细：总耗时、页数、平均每页耗时和最慢的一页"""
+    pages = timing["pages"]
+    if not pages:
+        logging.info(f"Parsed {pdf_path} in {timing['elapsed']:.2f}s (no pages).")
+        return
+    slowest = max(range(len(pages)), key=pages.__getitem__)
+    logging.info(
+        f"Parsed {pdf_path} in {timing['elapsed']:.2f}s: {len(pages)} pages, "
+        f"{sum(pages) / len(pages) * 1000:.1f}ms/page on average, "
+        f"slowest page {slowest + 1} took {pages[slowest] * 1000:.1f}ms.")
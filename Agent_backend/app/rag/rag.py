@@ -1,67 +1,353 @@
 import logging
+import os
+import threading
+import time
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.runnables.base import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 from .chroma_conn import ChromaDB
+from .bm25 import BM25Index, lexical_index_path
+from .collection_registry import (BUILD_PREFIX, active_collection, active_collection_path,
+                                  remove_collection_files, set_active_collection)
+from .context_packer import ContextPacker
+from .hashing import doc_content_hash
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-class RagManager:
-    def __init__(self, host, port, llm, embed):
-        self.host = host
-        self.port = port
-        self.llm = llm
-        self.embed = embed
-        self.chroma_db = ChromaDB(chroma_server_type="local", persist_path="chroma_db", embed=embed)
+class RetrievalIndex:
+    """一个集合对应的向量库、检索器和BM25词法索引，切换集合时整体替换"""
+
+    def __init__(self, persist_path, collection_name, embed, top_k, score_threshold):
+        self.collection_name = collection_name
+        self.chroma_db = ChromaDB(chroma_server_type="local", persist_path=persist_path,
+                                  collection_name=collection_name, embed=embed)
         self.store = self.chroma_db.get_store()
         self.retriever = self.chroma_db.get_retriever(
             search_type="similarity_score_threshold",
             search_kwargs={
-                "k": 20,  # 增加检索数量
-                "score_threshold": 0.3,  # 降低相似度阈值
+                "k": top_k,  # 增加检索数量
+                "score_threshold": score_threshold,  # 降低相似度阈值
                 "filter": None
             }
         )
+        # 与向量库同目录的BM25词法索引，由 PDFProcessor 导入时生成
+        self.lexical_index = BM25Index(lexical_index_path(persist_path, collection_name))
+
+
+class RagManager:
+    def __init__(self, host, port, llm, embed,
+                 search_mode="similarity",  # 向量检索方式：similarity 为相似度检索，mmr 为最大边际相关性（兼顾多样性）
+                 retrieval_mode="hybrid",  # 检索模式：vector 仅向量，lexical 仅BM25，hybrid 两者按倒数排名融合
+                 top_k=20,  # 最多返回的文档数
+                 fetch_k=40,  # mmr 模式下的候选文档数
+                 score_threshold=0.3,  # 相关度阈值，低于该值的文档直接丢弃
+                 lexical_min_coverage=0.5,  # BM25结果至少包含查询中该比例的词，否则丢弃（BM25分数无法与相关度阈值比较）
+                 mmr_lambda=0.5,  # mmr 相关性与多样性的权衡，越大越偏向相关性
+                 rrf_k=60,  # 倒数排名融合的平滑常数
+                 context_token_budget=3000,  # 拼入提示词的上下文token预算
+                 persist_path="chroma_db",
+                 collection_name=None):  # 检索的集合，默认为当前生效的集合
+        self.host = host
+        self.port = port
+        self.llm = llm
+        self.embed = embed
+        self.search_mode = search_mode
+        self.retrieval_mode = retrieval_mode
+        self.top_k = top_k
+        self.fetch_k = fetch_k
+        self.score_threshold = score_threshold
+        self.lexical_min_coverage = lexical_min_coverage
+        self.mmr_lambda = mmr_lambda
+        self.rrf_k = rrf_k
+        self.persist_path = persist_path
+        # 当前生效的集合；每次检索开始时取一次引用，切换集合时整体替换，查询不会看到写了一半的索引
+        # 未指定集合时跟随 active_collection.json，其他进程（如另一个 uvicorn worker）切换集合后同样生效
+        self._follow_active = collection_name is None
+        self._active_mtime = self._active_pointer_mtime()
+        self._switch_lock = threading.Lock()
+        self._index = self._open_index(collection_name or active_collection(persist_path))
+        # 按token预算组装上下文
+        self.context_packer = ContextPacker(max_tokens=context_token_budget)
+        # 各检索模式的调用次数和耗时
+        self._stats_lock = threading.Lock()
+        self._retrieval_stats = {}
+        self._context_stats = {"count": 0, "input_tokens": 0, "packed_tokens": 0}
+        # RAG查询链只构建一次，之后每次查询直接复用
+        self.rag_chain = self.get_chain()
+
+    def _open_index(self, collection_name):
+        return RetrievalIndex(self.persist_path, collection_name, self.embed, self.top_k, self.score_threshold)
+
+    def _active_pointer_mtime(self):
+        try:
+            return os.stat(active_collection_path(self.persist_path)).st_mtime_ns
+        except OSError:
+            return None
 
-    def search_documents(self, query):
+    def _current_index(self):
         """
-        检索相关文档
+        当前生效集合的索引：记录文件的修改时间变化时重新读取，集合不同则打开新集合
+        每次检索前调用，只多一次 stat
         """
-        try:
-            # 获取检索结果
-            docs = self.retriever.get_relevant_documents(query)
+        if self._follow_active:
+            mtime = self._active_pointer_mtime()
+            if mtime != self._active_mtime:
+                with self._switch_lock:
+                    self._active_mtime = mtime
+                    name = active_collection(self.persist_path)
+                    if name != self._index.collection_name:
+                        logging.info(f"知识库跟随切换到集合 {name}（原集合 {self._index.collection_name}）")
+                        self._index = self._open_index(name)
+        return self._index
+
+    @property
+    def collection_name(self):
+        return self._current_index().collection_name
+
+    @property
+    def chroma_db(self):
+        return self._current_index().chroma_db
 
-            # 对结果进行去重和排序
-            unique_docs = []
-            seen_content = set()
+    @property
+    def store(self):
+        return self._current_index().store
 
-            for doc in docs:
-                # 标准化内容进行比较
-                normalized_content = doc.page_content.replace(' ', '').replace('\n', '')
-                if normalized_content not in seen_content:
-                    seen_content.add(normalized_content)
-                    # 添加相似度分数到元数据
-                    if hasattr(doc, 'metadata'):
-                        doc.metadata['score'] = doc.metadata.get('score', 0)
-                    unique_docs.append(doc)
+    @property
+    def retriever(self):
+        return self._current_index().retriever
 
-            # 按相似度分数排序
-            unique_docs.sort(key=lambda x: x.metadata.get('score', 0), reverse=True)
+    @property
+    def lexical_index(self):
+        return self._current_index().lexical_index
 
-            # 打印检索到的文档数量
-            print(f"\n共检索到 {len(unique_docs)} 个相关文档")
+    def switch_collection(self, collection_name, keep_previous=True):
+        """
+        切换到新建好的集合：先打开新集合，再一次性替换引用，并记录为当前生效的集合
+        其他进程在下一次检索前跟随切换；旧集合保留一代（正在进行的查询可能还在使用），更早的后台重建集合会被删除
+        Returns:
+            切换前的集合名
+        """
+        new_index = self._open_index(collection_name)
+        # 先同步其他进程可能已做的切换，保证保留的是真正的上一代集合
+        self._current_index()
+        with self._switch_lock:
+            previous = self._index
+            self._index = new_index
+            set_active_collection(self.persist_path, collection_name)
+            self._active_mtime = self._active_pointer_mtime()
+        logging.info(f"知识库已切换到集合 {collection_name}（原集合 {previous.collection_name}）")
 
-            return unique_docs[:20]  # 返回前20个最相关的结果
+        keep = {collection_name, previous.collection_name} if keep_previous else {collection_name}
+        for name in new_index.chroma_db.list_collections():
+            if name.startswith(BUILD_PREFIX) and name not in keep:
+                new_index.chroma_db.delete_collection(name)
+                remove_collection_files(self.persist_path, name)
+                logging.info(f"已删除旧集合 {name}")
+        return previous.collection_name
+
+    def search_documents(self, query, mode=None):
+        """
+        检索相关文档
+        Args:
+            query: 查询文本
+            mode: 检索模式（vector/lexical/hybrid），默认使用 retrieval_mode
+        Returns:
+            文档列表，metadata['score'] 为排序所用的分数：vector 为向量相关度，lexical 为BM25分数，
+            hybrid 为倒数排名融合分数（向量相关度另存于 vector_score，BM25分数存于 bm25_score）
+        """
+        mode = mode or self.retrieval_mode
+        index = self._current_index()
+        start = time.perf_counter()
+        try:
+            vector_docs = self._vector_search(index.store, query) if mode != "lexical" else []
+            lexical_docs = self._lexical_search(index.lexical_index, query) if mode != "vector" else []
+            return self._combine(mode, vector_docs, lexical_docs)
 
         except Exception as e:
             print(f"Error in search_documents: {str(e)}")
             return []
+        finally:
+            self._record(mode, time.perf_counter() - start)
+
+    async def asearch_documents(self, query, mode=None):
+        """
+        异步检索相关文档，不阻塞事件循环
+        """
+        mode = mode or self.retrieval_mode
+        index = self._current_index()
+        start = time.perf_counter()
+        try:
+            vector_docs = await self._avector_search(index.store, query) if mode != "lexical" else []
+            # BM25 检索在内存中完成，耗时很短，直接同步执行
+            lexical_docs = self._lexical_search(index.lexical_index, query) if mode != "vector" else []
+            return self._combine(mode, vector_docs, lexical_docs)
 
-    def get_chain(self, retriever):
-        """获取RAG查询链"""
+        except Exception as e:
+            print(f"Error in asearch_documents: {str(e)}")
+            return []
+        finally:
+            self._record(mode, time.perf_counter() - start)
+
+    def _vector_search(self, store, query):
+        """向量检索（带真实相关度分数）"""
+        if self.search_mode == "mmr":
+            scored = store.similarity_search_with_relevance_scores(query, k=self.fetch_k)
+            docs = store.max_marginal_relevance_search(
+                query, k=self.top_k, fetch_k=self.fetch_k, lambda_mult=self.mmr_lambda)
+            return self._select_docs(self._attach_scores(docs, scored), keep_order=True)
+
+        scored = store.similarity_search_with_relevance_scores(query, k=self.top_k)
+        return self._select_docs(scored)
+
+    async def _avector_search(self, store, query):
+        if self.search_mode == "mmr":
+            scored = await store.asimilarity_search_with_relevance_scores(query, k=self.fetch_k)
+            docs = await store.amax_marginal_relevance_search(
+                query, k=self.top_k, fetch_k=self.fetch_k, lambda_mult=self.mmr_lambda)
+            return self._select_docs(self._attach_scores(docs, scored), keep_order=True)
+
+        scored = await store.asimilarity_search_with_relevance_scores(query, k=self.top_k)
+        return self._select_docs(scored)
+
+    def _lexical_search(self, lexical_index, query):
+        """
+        BM25 词法检索，BM25 分数与相关度不在同一量纲，不参与相关度阈值过滤，
+        改为按查询词覆盖率过滤，避免只共有一个常见词（如 旅游）的文本块混入结果
+        """
+        docs = []
+        for doc, score in lexical_index.search(query, k=self.top_k, min_coverage=self.lexical_min_coverage):
+            doc.metadata['bm25_score'] = score
+            docs.append(doc)
+        return docs
+
+    def _combine(self, mode, vector_docs, lexical_docs):
+        if mode == "vector":
+            return vector_docs
+        if mode == "lexical":
+            for doc in lexical_docs:
+                doc.metadata['score'] = doc.metadata['bm25_score']
+            return lexical_docs
+        return self._fuse(vector_docs, lexical_docs)
+
+    def _fuse(self, *rankings):
+        """
+        倒数排名融合：score = Σ 1 / (rrf_k + 排名)，同一文本块按内容哈希合并
+        融合结果的 score 和 rrf_score 都是融合分数，向量检索的相关度移到 vector_score
+        """
+        fused = {}
+        docs = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking, start=1):
+                digest = doc_content_hash(doc)
+                fused[digest] = fused.get(digest, 0.0) + 1.0 / (self.rrf_k + rank)
+                if digest in docs:
+                    # 保留两路检索各自的分数
+                    docs[digest].metadata.update(
+                        {k: v for k, v in doc.metadata.items() if k not in docs[digest].metadata})
+                else:
+                    docs[digest] = doc
+        ordered = sorted(fused, key=fused.get, reverse=True)[:self.top_k]
+        results = []
+        for digest in ordered:
+            doc = docs[digest]
+            if 'score' in doc.metadata:
+                doc.metadata['vector_score'] = doc.metadata['score']
+            doc.metadata['rrf_score'] = doc.metadata['score'] = fused[digest]
+            results.append(doc)
+        print(f"融合后共 {len(results)} 个相关文档")
+        return results
+
+    def _record(self, mode, elapsed):
+        with self._stats_lock:
+            stats = self._retrieval_stats.setdefault(mode, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed * 1000
+            stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+
+    def retrieval_stats(self):
+        """各检索模式的调用次数和平均/最大耗时（毫秒），以及上下文组装前后的平均token数"""
+        with self._stats_lock:
+            result = {}
+            for mode, stats in self._retrieval_stats.items():
+                result[mode] = {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 2),
+                    "max_ms": round(stats["max_ms"], 2),
+                }
+            packed = self._context_stats
+            if packed["count"]:
+                result["context"] = {
+                    "count": packed["count"],
+                    "avg_input_tokens": round(packed["input_tokens"] / packed["count"], 1),
+                    "avg_packed_tokens": round(packed["packed_tokens"] / packed["count"], 1),
+                }
+        result["collection"] = self.collection_name
+        result["lexical_chunks"] = len(self.lexical_index)
+        return result
+
+    def evaluate(self, cases, modes=("vector", "lexical", "hybrid")):
+        """
+        离线评估各检索模式的召回率和耗时
+        Args:
+            cases: [(查询, 期望出现在检索结果中的关键词)]，命中任一结果的内容或来源即视为召回
+        Returns:
+            {模式: {"recall": 召回率, "avg_ms": 平均耗时}}
+        """
+        report = {}
+        for mode in modes:
+            hits = 0
+            elapsed = 0.0
+            for query, expected in cases:
+                start = time.perf_counter()
+                docs = self.search_documents(query, mode=mode)
+                elapsed += time.perf_counter() - start
+                if any(expected in doc.page_content or expected in str(doc.metadata.get('source', ''))
+                       for doc in docs):
+                    hits += 1
+            report[mode] = {
+                "recall": round(hits / len(cases), 4) if cases else 0.0,
+                "avg_ms": round(elapsed * 1000 / len(cases), 2) if cases else 0.0,
+            }
+            logging.info(f"检索模式 {mode}: 召回率 {report[mode]['recall']}, 平均耗时 {report[mode]['avg_ms']}ms")
+        return report
+
+    @staticmethod
+    def _attach_scores(docs, scored):
+        """mmr 检索结果不带分数，按内容哈希从相似度检索结果中取回分数"""
+        scores = {doc_content_hash(doc): score for doc, score in scored}
+        return [(doc, scores.get(doc_content_hash(doc), 0.0)) for doc in docs]
+
+    def _select_docs(self, scored, keep_order=False):
+        """
+        先按阈值和数量截断，再用内容哈希去重
+        Args:
+            scored: [(文档, 相关度分数)]
+            keep_order: 保留原有顺序（mmr 的顺序已兼顾多样性），否则按分数降序
+        """
+        scored = [(doc, score) for doc, score in scored if score >= self.score_threshold]
+        if not keep_order:
+            scored.sort(key=lambda item: item[1], reverse=True)
+        scored = scored[:self.top_k]
+
+        unique_docs = []
+        seen_hashes = set()
+        for doc, score in scored:
+            digest = doc_content_hash(doc)
+            if digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+            doc.metadata['score'] = score
+            unique_docs.append(doc)
+
+        # 打印检索到的文档数量
+        print(f"\n共检索到 {len(unique_docs)} 个相关文档")
+        return unique_docs
+
+    def get_chain(self):
+        """获取RAG查询链，检索通过 search_documents / asearch_documents 完成"""
         # RAG系统经典的 Prompt (A 增强的过程)
         prompt = ChatPromptTemplate.from_messages([
             ("human", """您是用于回答问题任务的助手。请使用以下检索到的上下文来回答问题。如果您不知道答案，请直接说明不知道。请用三个句子以内回答，并保持简洁。
@@ -73,10 +359,14 @@ class RagManager:
         # 定义一个函数，接收问题，使用search_documents检索，然后返回格式化的文档内容
         def search_and_format_docs(question):
             docs = self.search_documents(question)
-            return self.format_docs(docs)
+            return self.format_docs(docs, question)
+
+        async def asearch_and_format_docs(question):
+            docs = await self.asearch_documents(question)
+            return self.format_docs(docs, question)
 
-        # 将 format_docs 方法包装为 Runnable
-        search_docs_runnable = RunnableLambda(search_and_format_docs)
+        # 将 format_docs 方法包装为 Runnable，同时提供异步实现，ainvoke 时不占用线程
+        search_docs_runnable = RunnableLambda(search_and_format_docs, afunc=asearch_and_format_docs)
         # RAG 链
         rag_chain = (
                 {"context": search_docs_runnable,
@@ -89,21 +379,30 @@ class RagManager:
 
 
 
-    def format_docs(self, docs):
-        # 返回检索到的资料文件名称
-        logging.info(f"检索到资料文件个数：{len(docs)}")
-        retrieved_files = "\n".join([doc.metadata["source"] for doc in docs])
+    def format_docs(self, docs, question=None):
+        """按token预算组装上下文，只记录来源和大小，不再打印完整内容"""
+        context, stats = self.context_packer.pack(question, docs)
+        retrieved_files = "\n".join(stats["sources"])
+        logging.info(f"检索到资料文件个数：{len(stats['sources'])}")
         logging.info(f"资料文件分别是:\n{retrieved_files}")
-        retrieved_content = "\n\n".join(doc.page_content for doc in docs)
-        logging.info(f"检索到的资料为:\n{retrieved_content}")
-        return retrieved_content
-
-
+        logging.info(
+            f"上下文组装：{stats['input_chunks']} 个文本块（约 {stats['input_tokens']} tokens）"
+            f" -> {stats['packed_chunks']} 段，{stats['packed_chars']} 字符，"
+            f"约 {stats['packed_tokens']}/{stats['budget']} tokens")
+        with self._stats_lock:
+            packed = self._context_stats
+            packed["count"] += 1
+            packed["input_tokens"] += stats["input_tokens"]
+            packed["packed_tokens"] += stats["packed_tokens"]
+        return context
 
     def get_result(self, question):  # 4  0.3
         """获取RAG查询结果"""
         # 输出的结果已经经过解析了，可以直接使用
         # retriever = self.get_retriever(k, mutuality)
 
-        rag_chain = self.get_chain(self.retriever)
-        return rag_chain.invoke(input=question)
\ No newline at end of file
+        return self.rag_chain.invoke(input=question)
+
+    async def aget_result(self, question):
+        """异步获取RAG查询结果，检索和大模型调用均为异步"""
+        return await self.rag_chain.ainvoke(input=question)
\ No newline at end of file
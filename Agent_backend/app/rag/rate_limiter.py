@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """
+    自适应请求速率限制（令牌桶，线程安全）
+    - acquire() 阻塞到可以发出下一个请求；
+    - 请求被限流或失败时调用 penalize()，速率减半；
+    - 请求成功时调用 reward()，速率缓慢回升，不超过 max_rate。
+    """
+
+    def __init__(self, max_rate, min_rate=0.2, increase=0.1):
+        self.max_rate = max_rate  # 每秒最多请求数
+        self.min_rate = min_rate
+        self.increase = increase  # 每次成功后速率增加的量
+        self.rate = max_rate
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def penalize(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
@@ -0,0 +1,138 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# 归一化时去掉的空白和标点
+_PUNCT_PATTERN = re.compile(r"[\s,.!?;:，。！？；：、~～\"'“”‘’()（）\[\]【】]+")
+
+
+def normalize_question(text):
+    """问题归一化：去空白和标点、转小写"""
+    return _PUNCT_PATTERN.sub("", str(text)).lower()
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：以归一化问题的向量为键缓存智能体回答
+    - 与已缓存问题的余弦相似度不低于 threshold 时视为命中；
+    - 传入 scope 时（如问题中的目的地），只与 scope 相同的已缓存问题比较相似度，
+      只差一个城市名的模板问题（厦门三日游攻略 / 北京三日游攻略）向量很接近，不能互相命中；
+    - 超过 ttl 秒的条目失效，超出 max_entries 时按 LRU 淘汰；
+    - 知识库重建后调用 invalidate() 清空；
+    - 传入 generation 时，每次查找和写入前检查知识库版本，版本变化则清空。
+      缓存在每个worker进程内各自保存，版本取自共享的存储（如当前生效的集合名），
+      因此一个worker完成重建后，其他worker也会在下次访问时失效。
+    是否可以使用缓存（首轮对话、非时效性问题）由调用方判断。
+    """
+
+    def __init__(self, embed, threshold=0.92, max_entries=500, ttl=24 * 3600, generation=None, scope=None):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = generation  # 返回知识库版本的无参函数，可能读取文件，在线程中调用
+        self._generation = None
+        self.scope = scope  # 问题 -> 作用域（如目的地城市，可为 None）的函数，作用域不同的问题不会语义命中
+        self._entries = OrderedDict()  # 归一化问题 -> (单位向量, 回答, 写入时间, 作用域)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now):
+        """删除过期条目（调用方需持有锁）"""
+        expired = [key for key, (_, _, created, _) in self._entries.items() if now - created >= self.ttl]
+        for key in expired:
+            del self._entries[key]
+            self._stats["evictions"] += 1
+
+    def _exact(self, key, now):
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["exact_hits"] += 1
+            return entry[1]
+
+    def _scope_of(self, question):
+        return self.scope(question) if self.scope is not None else None
+
+    def _nearest(self, vector, scope=None):
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry[3] == scope]
+            if not keys:
+                self._stats["misses"] += 1
+                return None
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self._stats["hits"] += 1
+            return self._entries[keys[best]][1]
+
+    async def _acheck_generation(self):
+        """知识库版本变化时清空缓存"""
+        if self.generation is None:
+            return
+        current = await asyncio.to_thread(self.generation)
+        with self._lock:
+            if current == self._generation:
+                return
+            if self._generation is not None:
+                self._entries.clear()
+                self._stats["invalidations"] += 1
+            self._generation = current
+
+    async def alookup(self, question):
+        """查找缓存的回答，未命中返回 (None, 问题向量)，向量可在写入时复用"""
+        await self._acheck_generation()
+        key = normalize_question(question)
+        answer = self._exact(key, time.monotonic())
+        if answer is not None:
+            return answer, None
+        vector = self._unit(await self.embed.aembed_query(key))
+        return self._nearest(vector, self._scope_of(question)), vector
+
+    async def astore(self, question, answer, vector=None):
+        """写入回答"""
+        if not answer:
+            return
+        await self._acheck_generation()
+        key = normalize_question(question)
+        if vector is None:
+            vector = self._unit(await self.embed.aembed_query(key))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (vector, answer, time.monotonic(), self._scope_of(question))
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        """清空缓存（知识库重建后调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
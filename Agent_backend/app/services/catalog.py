@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+class AttractionCatalog:
+    """
+    景点目录：启动时将 all.json 一次性加载为按城市索引的内存结构，
+    仅在文件修改时间(mtime)变化时重新加载，并支持分页、字段投影和ETag。
+    """
+
+    def __init__(self, path="all.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._index = {}  # 城市 -> 景点列表
+        self._digests = {}  # 城市 -> 内容摘要，用于生成ETag
+        self.reload_count = 0
+        self._maybe_reload()
+
+    def _load(self, mtime):
+        """读取文件并重建索引（调用方需持有锁）"""
+        with open(self.path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+        index = {}
+        digests = {}
+        for city, spots in data.items():
+            spots = spots if isinstance(spots, list) else []
+            index[city] = spots
+            raw = json.dumps(spots, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            digests[city] = hashlib.md5(raw).hexdigest()
+
+        self._index = index
+        self._digests = digests
+        self._mtime = mtime
+        self.reload_count += 1
+        logging.info(f"景点目录已加载: {len(index)} 个城市, 来源 {self.path}")
+
+    def _maybe_reload(self):
+        """文件 mtime 变化时才重新加载"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logging.error(f"读取景点文件状态失败: {str(e)}")
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+
+    def cities(self):
+        """返回目录中所有城市名称"""
+        self._maybe_reload()
+        return list(self._index.keys())
+
+    def get(self, city, offset=0, limit=None, fields=None):
+        """
+        获取某城市的景点列表
+        Args:
+            city: 城市名称
+            offset: 分页起始位置
+            limit: 返回数量，None 表示全部
+            fields: 需要返回的字段列表，None 表示全部字段
+        Returns:
+            (景点列表, 该城市景点总数)
+        """
+        self._maybe_reload()
+        spots = self._index.get(city, [])
+        total = len(spots)
+
+        offset = max(int(offset or 0), 0)
+        end = total if limit is None else offset + max(int(limit), 0)
+        page = spots[offset:end]
+
+        if fields:
+            page = [{k: spot[k] for k in fields if k in spot} for spot in page]
+        return page, total
+
+    def etag(self, city, offset=0, limit=None, fields=None):
+        """根据城市内容摘要和查询参数生成ETag"""
+        self._maybe_reload()
+        digest = self._digests.get(city, "empty")
+        key = f"{city}|{digest}|{offset}|{limit}|{','.join(fields or [])}"
+        return '"' + hashlib.md5(key.encode('utf-8')).hexdigest() + '"'
@@ -0,0 +1,112 @@
+import csv
+import logging
+
+try:
+    import pinyin
+except ImportError:  # 拼音别名为可选功能
+    pinyin = None
+
+# 查询时可去掉的行政级别后缀（按长度从长到短匹配）
+ADMIN_SUFFIXES = ("自治州", "自治县", "地区", "新区", "市", "区", "县", "盟", "旗")
+
+
+class CityGazetteer:
+    """
+    城市地名索引：由 China-City-List-latest.csv 一次性构建，
+    精确查询走哈希索引，模糊查询走二元组(bigram)倒排索引，不依赖pandas。
+
+    同名城市的消歧规则（固定、可复现）：
+        1. 与 adm1 / adm2 提示一致的记录优先；
+        2. 地级市/自治州本身（行政区划代码以00结尾且与 Adm2 同名）优先于同名区县；
+        3. 最后按 Location_ID 升序。
+    """
+
+    def __init__(self, csv_path="China-City-List-latest.csv", encoding="gbk"):
+        self.csv_path = csv_path
+        self.records = []  # 按 Location_ID 排序的城市记录
+        self._exact = {}  # 名称/别名 -> 记录下标列表
+        self._grams = {}  # 二元组/单字 -> 记录下标集合
+        self._load(encoding)
+
+    @staticmethod
+    def _strip_suffix(name):
+        """去掉行政级别后缀，如 厦门市 -> 厦门"""
+        for suffix in ADMIN_SUFFIXES:
+            if len(name) > len(suffix) + 1 and name.endswith(suffix):
+                return name[:-len(suffix)]
+        return name
+
+    @staticmethod
+    def _normalize(name):
+        return str(name).strip().lower().replace(" ", "")
+
+    @staticmethod
+    def _grams_of(text):
+        if len(text) < 2:
+            return set(text)
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def _load(self, encoding):
+        with open(self.csv_path, "r", encoding=encoding, newline="") as f:
+            rows = [row for row in csv.DictReader(f) if row.get("Location_ID")]
+        rows.sort(key=lambda r: r["Location_ID"])
+        self.records = rows
+
+        for idx, row in enumerate(rows):
+            name_zh = row["Location_Name_ZH"].strip()
+            aliases = {name_zh, self._normalize(row["Location_Name_EN"])}
+            if pinyin is not None:
+                aliases.add(pinyin.get(name_zh, format="strip", delimiter=""))
+            for alias in aliases:
+                if alias:
+                    self._exact.setdefault(self._normalize(alias), []).append(idx)
+            for gram in self._grams_of(name_zh):
+                self._grams.setdefault(gram, set()).add(idx)
+
+        logging.info(f"城市索引已构建: {len(rows)} 条记录, {len(self._exact)} 个名称/别名")
+
+    def _rank(self, indices, adm1=None, adm2=None):
+        """按消歧规则排序"""
+        def key(idx):
+            row = self.records[idx]
+            name = row["Location_Name_ZH"]
+            hint_miss = 0
+            if adm1 and not row["Adm1_Name_ZH"].startswith(self._strip_suffix(adm1)):
+                hint_miss += 1
+            if adm2 and not row["Adm2_Name_ZH"].startswith(self._strip_suffix(adm2)):
+                hint_miss += 1
+            is_seat = row["AD_code"].endswith("00") and row["Adm2_Name_ZH"].startswith(name)
+            return hint_miss, not is_seat, row["Location_ID"]
+        return [self.records[i] for i in sorted(set(indices), key=key)]
+
+    def exact(self, name, adm1=None, adm2=None):
+        """精确查询（中文名、英文名或拼音），返回按消歧规则排序的记录列表"""
+        key = self._normalize(name)
+        indices = self._exact.get(key)
+        if not indices:
+            indices = self._exact.get(self._strip_suffix(key))
+        return self._rank(indices, adm1, adm2) if indices else []
+
+    def search(self, text, limit=10, adm1=None, adm2=None):
+        """子串模糊查询：先用二元组倒排索引求候选，再校验子串包含关系"""
+        text = str(text).strip()
+        if not text:
+            return []
+        candidates = None
+        for gram in self._grams_of(text):
+            postings = self._grams.get(gram)
+            if not postings:
+                return []
+            candidates = set(postings) if candidates is None else candidates & postings
+        matched = [i for i in candidates if text in self.records[i]["Location_Name_ZH"]]
+        return self._rank(matched, adm1, adm2)[:limit]
+
+    def lookup(self, name, adm1=None, adm2=None):
+        """先精确后模糊，返回最佳匹配记录，找不到返回None"""
+        records = self.exact(name, adm1, adm2) or self.search(name, 1, adm1, adm2)
+        return records[0] if records else None
+
+    def get_location_id(self, name, adm1=None, adm2=None):
+        """返回和风天气 Location_ID，找不到返回None"""
+        record = self.lookup(name, adm1, adm2)
+        return record["Location_ID"] if record else None
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+# 默认超时：连接5秒，读写10秒
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+# 连接池上限：总连接数 / 保持长连接的空闲连接数
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+# 每个主机的并发请求上限，避免单个上游占满连接池
+PER_HOST_LIMIT = 10
+
+_lock = threading.Lock()
+_sync_client = None
+_async_client = None
+_sync_host_limits = {}
+_async_host_limits = {}
+
+
+def get_client():
+    """获取进程内共享的同步HTTP客户端（带连接池和长连接）"""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS, follow_redirects=True)
+    return _sync_client
+
+
+def get_async_client():
+    """获取进程内共享的异步HTTP客户端（带连接池和长连接）"""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS, follow_redirects=True)
+    return _async_client
+
+
+def _host_of(url):
+    return urlsplit(url).netloc
+
+
+def get(url, **kwargs):
+    """同步GET请求，受每主机并发上限约束"""
+    host = _host_of(url)
+    with _lock:
+        limit = _sync_host_limits.setdefault(host, threading.BoundedSemaphore(PER_HOST_LIMIT))
+    with limit:
+        return get_client().get(url, **kwargs)
+
+
+async def aget(url, **kwargs):
+    """异步GET请求，受每主机并发上限约束，不阻塞事件循环"""
+    host = _host_of(url)
+    limit = _async_host_limits.setdefault(host, asyncio.Semaphore(PER_HOST_LIMIT))
+    async with limit:
+        return await get_async_client().get(url, **kwargs)
+
+
+async def aclose():
+    """关闭共享客户端，应用退出时调用"""
+    global _sync_client, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
@@ -0,0 +1,224 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class IngestionJob:
+    """一次知识库重建任务的状态"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}  # 由重建函数替换为 PDFProcessor.progress，运行中实时更新
+        self.result = None
+        self.error = None
+
+    @classmethod
+    def from_row(cls, row):
+        job_id, status, created_at, started_at, finished_at, progress, result, error = row
+        job = cls(job_id)
+        job.status = status
+        job.created_at = created_at
+        job.started_at = started_at
+        job.finished_at = finished_at
+        job.progress = json.loads(progress) if progress else {}
+        job.result = json.loads(result) if result else None
+        job.error = error
+        return job
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "elapsed": round(end - self.started_at, 2) if self.started_at else 0.0,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestionJobManager:
+    """
+    知识库重建的后台任务，任务状态保存在SQLite中，多个uvicorn worker进程共享
+    - 任务在提交它的进程中由后台线程执行，任一进程都能查询任务状态和进度；
+    - 同一时间（跨进程）只运行一个任务，提交时已有任务未完成则返回该任务（可选择排队），
+      排队的任务在自己的线程中等待前一个任务结束，等待期间持续更新心跳；
+    - 重建函数 build(job) 通过 job.progress 报告进度，返回值记入 job.result；
+    - 排队和运行中的任务每 heartbeat_interval 秒写入一次心跳和进度，
+      心跳超过 stale_after 秒未更新的任务视为所在进程已退出，标记为失败；
+    - 只保留最近 max_history 个任务的状态。
+    """
+
+    _COLUMNS = "job_id, status, created_at, started_at, finished_at, progress, result, error"
+
+    def __init__(self, build, db_path="ingest_jobs.db", max_history=20, heartbeat_interval=1.0, stale_after=60):
+        self.build = build
+        self.db_path = db_path
+        self.max_history = max_history
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self):
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat REAL NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT
+            )""")
+
+    def _transaction(self, func):
+        """在写事务中执行 func(conn)，同一时间只有一个进程能进入"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _expire_stale(self, conn):
+        """心跳超时的未完成任务标记为失败（调用方需在事务中）"""
+        now = time.time()
+        conn.execute(
+            """UPDATE ingest_jobs SET status = 'failed', error = '执行任务的进程已退出', finished_at = ?
+               WHERE status IN ('queued', 'running') AND heartbeat < ?""",
+            (now, now - self.stale_after))
+
+    def _unfinished(self, conn):
+        rows = conn.execute(
+            f"""SELECT {self._COLUMNS} FROM ingest_jobs
+                WHERE status IN ('queued', 'running') ORDER BY created_at""").fetchall()
+        return [IngestionJob.from_row(row) for row in rows]
+
+    def submit(self, queue_if_running=False):
+        """
+        提交重建任务
+        Args:
+            queue_if_running: 已有任务在运行时，排队一个新任务在其后执行（如新上传的文件需要导入）
+        Returns:
+            (任务, 是否新建)；已有排队中的任务时返回该任务，它开始执行时会包含最新的文件
+        """
+        def create(conn):
+            self._expire_stale(conn)
+            unfinished = self._unfinished(conn)
+            queued = next((job for job in unfinished if job.status == "queued"), None)
+            if queued is not None:
+                return queued, False
+            if unfinished and not queue_if_running:
+                return unfinished[0], False
+            job = IngestionJob(uuid.uuid4().hex)
+            conn.execute(
+                "INSERT INTO ingest_jobs (job_id, status, created_at, heartbeat) VALUES (?, ?, ?, ?)",
+                (job.job_id, job.status, job.created_at, job.created_at))
+            conn.execute(
+                """DELETE FROM ingest_jobs WHERE status IN ('succeeded', 'failed') AND job_id NOT IN (
+                       SELECT job_id FROM ingest_jobs ORDER BY created_at DESC LIMIT ?)""",
+                (self.max_history,))
+            return job, True
+
+        job, created = self._transaction(create)
+        if created:
+            threading.Thread(target=self._run, args=(job,), name="kb-build", daemon=True).start()
+        return job, created
+
+    def _claim(self, job):
+        """等待其他任务（可能在其他进程中）结束后，把本任务标记为运行中"""
+        def try_claim(conn):
+            """返回 claimed / waiting / lost；不抛异常，清理超时任务的修改总会提交"""
+            self._expire_stale(conn)
+            now = time.time()
+            # 排队等待期间也更新心跳，避免被当作已退出
+            cursor = conn.execute("UPDATE ingest_jobs SET heartbeat = ? WHERE job_id = ? AND status = 'queued'",
+                                  (now, job.job_id))
+            if cursor.rowcount == 0:
+                return "lost"
+            running = conn.execute("SELECT 1 FROM ingest_jobs WHERE status = 'running' LIMIT 1").fetchone()
+            if running is not None:
+                return "waiting"
+            conn.execute("UPDATE ingest_jobs SET status = 'running', started_at = ? WHERE job_id = ?",
+                         (now, job.job_id))
+            job.started_at = now
+            return "claimed"
+
+        while True:
+            state = self._transaction(try_claim)
+            if state == "claimed":
+                break
+            if state == "lost":
+                raise RuntimeError(f"知识库重建任务 {job.job_id} 已失效")
+            time.sleep(self.heartbeat_interval)
+        job.status = "running"
+
+    def _heartbeat(self, job, done):
+        """运行期间定期写入心跳和进度"""
+        conn = self._connection()
+        while not done.wait(self.heartbeat_interval):
+            conn.execute("UPDATE ingest_jobs SET heartbeat = ?, progress = ? WHERE job_id = ?",
+                         (time.time(), json.dumps(job.progress, ensure_ascii=False), job.job_id))
+
+    def _run(self, job):
+        try:
+            self._claim(job)
+        except Exception as e:
+            logging.error(f"知识库重建任务 {job.job_id} 无法开始: {str(e)}")
+            return
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done),
+                                     name="kb-build-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            job.result = self.build(job)
+            job.status = "succeeded"
+            logging.info(f"知识库重建任务 {job.job_id} 完成: {job.result}")
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            logging.exception(f"知识库重建任务 {job.job_id} 失败")
+        finally:
+            done.set()
+            heartbeat.join()
+            job.finished_at = time.time()
+            self._connection().execute(
+                """UPDATE ingest_jobs SET status = ?, finished_at = ?, heartbeat = ?, progress = ?,
+                       result = ?, error = ? WHERE job_id = ?""",
+                (job.status, job.finished_at, job.finished_at, json.dumps(job.progress, ensure_ascii=False),
+                 json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                 job.error, job.job_id))
+
+    def get(self, job_id):
+        """查询任务状态（可以是其他进程提交的任务），不存在时返回 None"""
+        row = self._connection().execute(
+            f"SELECT {self._COLUMNS} FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return IngestionJob.from_row(row) if row is not None else None
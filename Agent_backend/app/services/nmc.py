@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import sys
+
+NMC_URL_TEMPLATE = "http://www.nmc.cn/publish/forecast/{province_code}/{city_pinyin}.html"
+DEFAULT_OVERRIDE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'nmc_overrides.json'))
+
+
+def load_overrides(path=DEFAULT_OVERRIDE_PATH):
+    """读取NMC拼音覆盖表（城市 -> NMC页面使用的拼音）"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_nmc_url_table(province_dict, overrides=None):
+    """
+    根据省份字典生成 城市 -> NMC天气预报URL 的映射表
+    同一城市出现在多个省份时，以首次出现的省份为准
+    """
+    import pinyin
+
+    overrides = overrides or {}
+    table = {}
+    for province_code, cities in province_dict.items():
+        for city_name in cities:
+            if city_name in table:
+                continue
+            city_pinyin = overrides.get(city_name) or pinyin.get(city_name, format="strip", delimiter="")
+            table[city_name] = NMC_URL_TEMPLATE.format(province_code=province_code, city_pinyin=city_pinyin)
+    logging.info(f"NMC天气URL表已生成: {len(table)} 个城市")
+    return table
+
+
+def validate_nmc_url_table(table, locations):
+    """
+    离线校验URL表，返回问题列表
+    检查项：locations 中的城市是否都有URL、URL是否重复
+    """
+    problems = []
+    for city_name in locations:
+        if city_name not in table:
+            problems.append(f"缺少URL: {city_name}")
+
+    seen = {}
+    for city_name, url in table.items():
+        if url in seen:
+            problems.append(f"URL重复: {city_name} 与 {seen[url]} -> {url}")
+        else:
+            seen[url] = city_name
+    return problems
+
+
+if __name__ == "__main__":
+    # 构建步骤：python -m app.services.nmc [输出文件]，生成并校验URL表
+    from data import locations, province_dict
+
+    url_table = build_nmc_url_table(province_dict, load_overrides())
+    for problem in validate_nmc_url_table(url_table, locations):
+        print(problem)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w', encoding='utf-8') as out:
+            json.dump(url_table, out, ensure_ascii=False, indent=2)
+        print(f"已写入 {sys.argv[1]}")
+    else:
+        print(json.dumps(url_table, ensure_ascii=False, indent=2))
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+import uuid
+import zipfile
+
+PDF_MAGIC = b"%PDF-"
+
+
+class PDFUploadStore:
+    """
+    PDF上传目录管理
+    - 按 chunk_size 分块写入临时文件，边写边计算sha256，内存占用与文件大小无关；
+    - 与目录中已有文件内容相同的上传直接丢弃；
+    - 文件名冲突但内容不同时自动加序号，不覆盖已有文件；
+    - 支持zip压缩包，逐个解出其中的PDF。
+    目录中已有文件的哈希按 (大小, 修改时间) 缓存，只在文件变化时重新计算。
+    """
+
+    def __init__(self, directory, chunk_size=1 << 20, max_file_size=200 << 20):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.max_file_size = max_file_size  # 单个PDF的大小上限，防止异常文件或压缩炸弹占满磁盘
+        self._lock = threading.Lock()
+        self._cache = {}  # 文件名 -> (大小, 修改时间, sha256)
+        os.makedirs(directory, exist_ok=True)
+
+    def _known_hashes(self):
+        """目录中已有PDF的 sha256 -> 文件名（调用方需持有锁）"""
+        current = {}
+        for name in os.listdir(self.directory):
+            if not name.lower().endswith('.pdf'):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            cached = self._cache.get(name)
+            if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b''):
+                        digest.update(block)
+                cached = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+            current[name] = cached
+        self._cache = current
+        return {digest: name for name, (_, _, digest) in current.items()}
+
+    def _target_name(self, filename):
+        """去掉路径部分；重名时加序号"""
+        base, ext = os.path.splitext(os.path.basename(filename.replace('\\', '/')))
+        name = f"{base}{ext}"
+        index = 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            name = f"{base} ({index}){ext}"
+            index += 1
+        return name
+
+    def save_stream(self, filename, stream):
+        """
+        保存一个PDF文件流
+        Args:
+            filename: 上传时的文件名
+            stream: 可分块读取的文件对象
+        Returns:
+            {"filename", "status": saved/duplicate/rejected, "sha256", "size", "message"}
+        """
+        result = {"filename": os.path.basename(filename.replace('\\', '/')), "status": "rejected",
+                  "sha256": None, "size": 0, "message": ""}
+        if not result["filename"].lower().endswith('.pdf'):
+            result["message"] = "只支持PDF文件格式"
+            return result
+
+        tmp_path = os.path.join(self.directory, f".upload-{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            header = b''
+            with open(tmp_path, 'wb') as out:
+                for block in iter(lambda: stream.read(self.chunk_size), b''):
+                    # 检查文件头，拒绝扩展名是.pdf但内容不是PDF的文件
+                    if len(header) < len(PDF_MAGIC):
+                        header += block[:len(PDF_MAGIC) - len(header)]
+                        if not PDF_MAGIC.startswith(header):
+                            result["message"] = "文件内容不是PDF"
+                            return result
+                    size += len(block)
+                    if size > self.max_file_size:
+                        result["message"] = f"文件超过大小上限 {self.max_file_size >> 20}MB"
+                        return result
+                    digest.update(block)
+                    out.write(block)
+            result.update(sha256=digest.hexdigest(), size=size)
+            if header != PDF_MAGIC:
+                result["message"] = "文件为空或内容不是PDF"
+                return result
+
+            with self._lock:
+                existing = self._known_hashes().get(result["sha256"])
+                if existing is not None:
+                    result.update(status="duplicate", message=f"与已有文件 {existing} 内容相同，已跳过")
+                    return result
+                name = self._target_name(result["filename"])
+                os.replace(tmp_path, os.path.join(self.directory, name))
+            result.update(filename=name, status="saved", message="文件上传成功")
+            return result
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def save_zip(self, stream):
+        """逐个保存zip压缩包中的PDF，其余文件忽略"""
+        results = []
+        with zipfile.ZipFile(stream) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith('.pdf'):
+                    continue
+                with archive.open(member) as member_stream:
+                    results.append(self.save_stream(member.filename, member_stream))
+        return results
+
+    def save_upload(self, filename, stream):
+        """按扩展名保存上传的PDF或zip，返回每个PDF的结果列表"""
+        if filename.lower().endswith('.zip'):
+            try:
+                return self.save_zip(stream)
+            except zipfile.BadZipFile:
+                return [{"filename": os.path.basename(filename), "status": "rejected",
+                         "sha256": None, "size": 0, "message": "无效的zip压缩包"}]
+        return [self.save_stream(filename, stream)]
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+from collections import deque
+
+DEFAULT_RULES_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'region_rules.json'))
+
+# 模式来源的优先级，数值越小越优先
+PRIORITY_ALIAS = 0  # 规则文件中的别名（如 鹭岛 -> 厦门）
+PRIORITY_LOCATION = 1  # locations / province_dict 中的城市名
+PRIORITY_PROVINCE = 2  # 省份名 -> 省会
+PRIORITY_DISTRICT = 3  # 城市列表CSV中的区县名 -> 所属城市
+
+
+class AhoCorasick:
+    """多模式串匹配自动机，一次扫描找出文本中所有模式的出现位置"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # 节点 -> [(模式长度, 值)]
+
+    def add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((len(pattern), value))
+
+    def build(self):
+        """广度优先构建失败指针"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def finditer(self, text):
+        """返回 (起始位置, 结束位置, 值) 的迭代器"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._output[node]:
+                yield i - length + 1, i + 1, value
+
+
+class RegionMatcher:
+    """
+    从用户消息中本地提取目的地城市
+    由 locations、province_dict、城市列表CSV 和 data/region_rules.json 构建 Aho-Corasick 自动机，
+    消息中只有一个候选城市时直接返回；没有命中或存在多个候选时交给大模型判断。
+    规则文件中的 blocked_patterns 是包含城市名但不能确定城市的地名（如 长白山 含 白山、中山路 含 中山），
+    命中后其中的城市名不再作为候选；没有其他候选时按 ambiguous 交给大模型判断。
+    """
+
+    def __init__(self, locations, province_dict=None, city_records=None, rules_path=DEFAULT_RULES_PATH):
+        self.locations = set(locations)
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        self.negation_prefixes = rules.get("negation_prefixes", [])
+        self.origin_prefixes = rules.get("origin_prefixes", [])
+        self.origin_suffixes = rules.get("origin_suffixes", [])
+
+        # 模式 -> (优先级, 目标城市)，同一模式保留优先级最高的目标；屏蔽的模式目标为 None
+        patterns = {pattern: (PRIORITY_ALIAS, None) for pattern in rules.get("blocked_patterns", [])}
+
+        blocked = set(patterns)
+
+        def register(pattern, target, priority):
+            if not pattern or target not in self.locations or pattern in blocked:
+                return
+            current = patterns.get(pattern)
+            if current is None or priority < current[0]:
+                patterns[pattern] = (priority, target)
+
+        for alias, target in rules.get("aliases", {}).items():
+            register(alias, target, PRIORITY_ALIAS)
+        for loc in locations:
+            register(loc, loc, PRIORITY_LOCATION)
+        for cities in (province_dict or {}).values():
+            for city in cities:
+                register(city, city, PRIORITY_LOCATION)
+        for province, capital in rules.get("province_capitals", {}).items():
+            register(province, capital, PRIORITY_PROVINCE)
+        for record in city_records or []:
+            name = record["Location_Name_ZH"].strip()
+            city = record["Adm2_Name_ZH"].strip()
+            target = next((loc for loc in (city, city[:-1], city[:2]) if loc in self.locations), None)
+            # 两个字的区县名容易与普通词语冲突（如"和平"、"长安"），只收录三个字及以上的
+            if target and len(name) >= 3:
+                register(name, target, PRIORITY_DISTRICT)
+
+        self._automaton = AhoCorasick()
+        for pattern, (priority, target) in patterns.items():
+            self._automaton.add(pattern, (priority, target))
+        self._automaton.build()
+        self.pattern_count = len(patterns)
+
+        self._lock = threading.Lock()
+        self._stats = {"fast_path": 0, "llm_fallback": 0, "ambiguous": 0, "no_match": 0}
+
+    def _is_excluded(self, text, start, end):
+        """出发地或明确不想去的地方不算目的地"""
+        before = text[max(0, start - 4):start]
+        after = text[end:end + 3]
+        if any(before.endswith(p) for p in self.negation_prefixes + self.origin_prefixes):
+            return True
+        return any(after.startswith(s) for s in self.origin_suffixes)
+
+    def _select(self, text):
+        """最左最长匹配，去掉被更长模式覆盖的短模式"""
+        hits = sorted(self._automaton.finditer(text), key=lambda h: (h[0], -(h[1] - h[0]), h[2][0]))
+        selected = []
+        covered_until = 0
+        for start, end, value in hits:
+            if start < covered_until:
+                continue
+            selected.append((start, end, value))
+            covered_until = end
+        return selected
+
+    def match(self, text):
+        """
+        提取目的地
+        Returns:
+            (城市, 状态)，状态为 "matched"、"ambiguous" 或 "no_match"
+        """
+        text = str(text)
+        hits = [(start, end, value) for start, end, value in self._select(text)
+                if not self._is_excluded(text, start, end)]
+        candidates = [(priority, target) for _, _, (priority, target) in hits if target is not None]
+        if not candidates:
+            return None, "ambiguous" if hits else "no_match"
+        best = min(priority for priority, _ in candidates)
+        targets = list(dict.fromkeys(target for priority, target in candidates if priority == best))
+        if len(targets) == 1:
+            return targets[0], "matched"
+        return None, "ambiguous"
+
+    def record(self, key):
+        """记录快速路径命中与大模型兜底次数"""
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["fast_path"] + stats["llm_fallback"]
+        stats["fast_path_rate"] = round(stats["fast_path"] / total, 4) if total else 0.0
+        stats["patterns"] = self.pattern_count
+        return stats
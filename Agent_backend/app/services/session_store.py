@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+
+
+class BoundedChatMessageHistory(ChatMessageHistory):
+    """只保留最近 max_messages 条消息的会话历史"""
+
+    max_messages: int = 50
+
+    def add_message(self, message):
+        super().add_message(message)
+        overflow = len(self.messages) - self.max_messages
+        if overflow > 0:
+            del self.messages[:overflow]
+
+
+class SessionStore:
+    """
+    有界会话存储：替代进程内无限增长的 store 字典
+    - 会话数超过 max_sessions 时按 LRU 淘汰；
+    - 超过 idle_ttl 秒未访问的会话被淘汰；
+    - 每个会话最多保留 max_messages 条消息。
+    """
+
+    def __init__(self, max_sessions=1000, idle_ttl=3600, max_messages=50):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()  # session_id -> (history, 最后访问时间)，按访问顺序排列
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evicted_lru": 0, "evicted_ttl": 0}
+
+    def _evict_expired(self, now):
+        """淘汰空闲超时的会话（调用方需持有锁）"""
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self._stats["evicted_ttl"] += 1
+
+    def get(self, session_id):
+        """获取会话历史，不存在则创建"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                history = BoundedChatMessageHistory(max_messages=self.max_messages)
+                self._stats["created"] += 1
+            else:
+                history = entry[0]
+            self._sessions[session_id] = (history, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted_lru"] += 1
+            return history
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """返回当前会话数和淘汰计数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._sessions)
+            stats["messages"] = sum(len(history.messages) for history, _ in self._sessions.values())
+        stats["max_sessions"] = self.max_sessions
+        stats["idle_ttl"] = self.idle_ttl
+        return stats
@@ -0,0 +1,134 @@
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+
+class SQLiteSessionStore:
+    """
+    基于SQLite(WAL模式)的持久化会话存储
+    - 多个uvicorn worker进程可共享同一个数据库文件，写入由SQLite文件锁串行化；
+    - 每条消息单独追加一行，不重写整段历史；
+    - 历史按需读取，每个会话只保留最近 max_messages 条；
+    - 空闲超过 idle_ttl 秒的会话会被定期清理。
+    """
+
+    def __init__(self, path="sessions.db", max_messages=50, idle_ttl=7 * 24 * 3600, prune_interval=600):
+        self.path = path
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._stats = {"loads": 0, "appends": 0, "pruned_messages": 0}
+        self._stats_lock = threading.Lock()
+        self._init_schema()
+
+    def connection(self):
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self.connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id)")
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def load(self, session_id):
+        """读取会话最近的 max_messages 条消息"""
+        rows = self.connection().execute(
+            "SELECT message FROM chat_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_messages),
+        ).fetchall()
+        self._count("loads")
+        return messages_from_dict([json.loads(row[0]) for row in reversed(rows)])
+
+    def append(self, session_id, messages):
+        """在一个事务中追加消息，并删除超出保留条数的旧消息"""
+        now = time.time()
+        rows = [(session_id, json.dumps(message_to_dict(m), ensure_ascii=False), now) for m in messages]
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO chat_messages (session_id, message, created_at) VALUES (?, ?, ?)", rows)
+            conn.execute(
+                """DELETE FROM chat_messages WHERE session_id = ? AND id <= (
+                       SELECT id FROM chat_messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                (session_id, session_id, self.max_messages),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("appends", len(rows))
+        self._maybe_prune()
+
+    def clear(self, session_id):
+        self.connection().execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+
+    def _maybe_prune(self):
+        """定期删除空闲超时的会话"""
+        now = time.time()
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        cursor = self.connection().execute(
+            """DELETE FROM chat_messages WHERE session_id IN (
+                   SELECT session_id FROM chat_messages GROUP BY session_id HAVING MAX(created_at) < ?)""",
+            (now - self.idle_ttl,),
+        )
+        self._count("pruned_messages", max(cursor.rowcount, 0))
+
+    def get(self, session_id):
+        """获取会话历史对象，供 RunnableWithMessageHistory 使用"""
+        return SQLiteChatMessageHistory(session_id, self)
+
+    def stats(self):
+        row = self.connection().execute(
+            "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM chat_messages").fetchone()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["size"] = row[0]
+        stats["messages"] = row[1]
+        stats["idle_ttl"] = self.idle_ttl
+        return stats
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """单个会话的持久化历史，读取时才访问数据库，写入只追加新消息"""
+
+    def __init__(self, session_id, store):
+        self.session_id = session_id
+        self.store = store
+
+    @property
+    def messages(self):
+        return self.store.load(self.session_id)
+
+    def add_messages(self, messages):
+        self.store.append(self.session_id, list(messages))
+
+    def add_message(self, message):
+        self.add_messages([message])
+
+    def clear(self):
+        self.store.clear(self.session_id)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until")
+
+    def __init__(self, value, expires_at, stale_until):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class _Flight:
+    """一次正在进行的上游请求，同一key的并发请求共享其结果"""
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class WeatherCache:
+    """
+    天气数据缓存层：按 (数据源, 城市) 缓存解析后的结果
+    - TTL 内直接命中；
+    - 过期但仍在 stale 窗口内时返回旧值，并在后台刷新（stale-while-revalidate）；
+    - 同一key的并发未命中只触发一次上游请求（single-flight）；
+    - 记录命中/未命中等计数，便于评估缓存容量。
+    """
+
+    def __init__(self, default_ttl=1800, stale_ttl=3600, max_entries=1024, refresh_workers=4):
+        self.default_ttl = default_ttl  # 新鲜期（秒）
+        self.stale_ttl = stale_ttl  # 过期后仍可返回旧值的时长（秒）
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self._ainflight = {}  # 异步请求的 single-flight 表，key -> asyncio.Future
+        self._tasks = set()  # 持有后台刷新任务的引用，防止被回收
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="weather-refresh")
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                       "fetches": 0, "refreshes": 0, "errors": 0}
+
+    def get(self, source, city, fetch, ttl=None, should_cache=bool):
+        """
+        获取缓存数据，未命中时调用 fetch() 拉取
+        Args:
+            source: 数据源名称，如 "nmc"、"qweather"
+            city: 城市名称或ID
+            fetch: 无参函数，返回解析后的天气数据，失败时抛出异常
+            ttl: 新鲜期（秒），默认使用 default_ttl
+            should_cache: 判断结果是否可缓存的函数，默认空结果不缓存
+        """
+        key = (source, city)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._stats["hits"] += 1
+                return entry.value
+            if entry is not None and now < entry.stale_until:
+                self._stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    flight = self._inflight[key] = _Flight()
+                    self._stats["refreshes"] += 1
+                    self._refresher.submit(self._run, key, flight, fetch, ttl, should_cache)
+                return entry.value
+
+            self._stats["misses"] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            self._run(key, flight, fetch, ttl, should_cache)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    async def aget(self, source, city, afetch, ttl=None, should_cache=bool):
+        """
+        get 的异步版本：afetch 为无参协程函数，
+        并发未命中共享同一个 Future，过期刷新在后台任务中进行
+        """
+        key = (source, city)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._stats["hits"] += 1
+                return entry.value
+            stale = entry is not None and now < entry.stale_until
+            self._stats["stale_hits" if stale else "misses"] += 1
+
+        future = self._ainflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._ainflight[key] = future
+            task = asyncio.create_task(self._arun(key, future, afetch, ttl, should_cache))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if stale:
+                with self._lock:
+                    self._stats["refreshes"] += 1
+                return entry.value
+            # 屏蔽取消：发起请求的客户端断开时上游请求继续进行，其他等待者仍能拿到结果
+            await asyncio.shield(task)
+        elif stale:
+            return entry.value
+        else:
+            with self._lock:
+                self._stats["coalesced"] += 1
+        return await asyncio.shield(future)
+
+    async def _arun(self, key, future, afetch, ttl, should_cache):
+        """执行一次异步上游请求并写入缓存"""
+        try:
+            with self._lock:
+                self._stats["fetches"] += 1
+            value = await afetch()
+            if should_cache(value):
+                self._store(key, value, ttl)
+            future.set_result(value)
+        except Exception as e:
+            logging.warning(f"天气数据拉取失败 {key}: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += 1
+            future.set_exception(e)
+            # 后台刷新失败时没有等待者，主动取走异常避免告警
+            if not future.cancelled():
+                future.exception()
+        finally:
+            # 任务本身被取消（如应用退出）时同样结束 Future，否则等待者会一直挂起
+            if not future.done():
+                future.set_exception(RuntimeError(f"天气数据请求已取消 {key}"))
+                future.exception()
+            self._ainflight.pop(key, None)
+
+    def _run(self, key, flight, fetch, ttl, should_cache):
+        """执行一次上游请求并写入缓存"""
+        try:
+            with self._lock:
+                self._stats["fetches"] += 1
+            value = fetch()
+            flight.value = value
+            if should_cache(value):
+                self._store(key, value, ttl)
+        except Exception as e:
+            logging.warning(f"天气数据拉取失败 {key}: {str(e)}")
+            flight.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _store(self, key, value, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl)
+            # 超出容量时淘汰最早写入的条目
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+
+    def invalidate(self, source=None, city=None):
+        """清除缓存，不传参数时清空全部"""
+        with self._lock:
+            if source is None and city is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if (source is None or k[0] == source)
+                        and (city is None or k[1] == city)]:
+                del self._entries[key]
+
+    def stats(self):
+        """返回缓存计数和当前条目数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# 将父目录添加到sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..')))
+
+from app.services.ingest_jobs import IngestionJobManager
+
+
+class TestIngestionJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "jobs.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def wait_finished(self, manager, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = manager.get(job_id)
+            if job.finished:
+                return job
+            time.sleep(0.05)
+        self.fail(f"任务 {job_id} 未在 {timeout}s 内结束")
+
+    def test_queued_job_survives_long_build(self):
+        """运行时间超过 stale_after 的任务之后排队的任务不会被当作已退出"""
+        runs = []
+        lock = threading.Lock()
+
+        def build(job):
+            with lock:
+                runs.append(job.job_id)
+            time.sleep(1.5)
+            return {"run": len(runs)}
+
+        manager = IngestionJobManager(build, db_path=self.db_path, heartbeat_interval=0.1, stale_after=0.5)
+        first, created = manager.submit()
+        self.assertTrue(created)
+        time.sleep(0.2)
+        queued, created = manager.submit(queue_if_running=True)
+        self.assertTrue(created)
+        self.assertNotEqual(first.job_id, queued.job_id)
+
+        self.assertEqual(self.wait_finished(manager, first.job_id).status, "succeeded")
+        second = self.wait_finished(manager, queued.job_id)
+        self.assertEqual(second.status, "succeeded")
+        self.assertEqual(runs, [first.job_id, queued.job_id])
+
+    def test_shared_across_managers(self):
+        """多个进程（此处用多个管理器模拟）共享任务状态，同一时间只运行一个任务"""
+        def build(job):
+            time.sleep(0.3)
+            return {"ok": True}
+
+        a = IngestionJobManager(build, db_path=self.db_path, heartbeat_interval=0.1)
+        b = IngestionJobManager(build, db_path=self.db_path, heartbeat_interval=0.1)
+        job, created = a.submit()
+        self.assertTrue(created)
+        same, created = b.submit()
+        self.assertFalse(created)
+        self.assertEqual(same.job_id, job.job_id)
+        self.assertEqual(self.wait_finished(b, job.job_id).result, {"ok": True})
+
+    def test_dead_worker_job_expires(self):
+        """心跳超时的任务标记为失败，不再阻塞新任务"""
+        manager = IngestionJobManager(lambda job: None, db_path=self.db_path, stale_after=0.2)
+        manager._connection().execute(
+            "INSERT INTO ingest_jobs (job_id, status, created_at, heartbeat) VALUES ('dead', 'running', 0, 0)")
+        job, created = manager.submit()
+        self.assertTrue(created)
+        self.assertEqual(manager.get("dead").status, "failed")
+        self.assertEqual(self.wait_finished(manager, job.job_id).status, "succeeded")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+import unittest
+
+# 将父目录添加到sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..')))
+
+from app.services.weather_cache import WeatherCache
+
+
+class TestWeatherCacheSingleFlight(unittest.TestCase):
+
+    def test_leader_cancelled(self):
+        """发起请求的协程被取消后，共享同一请求的等待者仍能拿到结果"""
+        cache = WeatherCache()
+        calls = []
+
+        async def afetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ["晴"]
+
+        async def main():
+            leader = asyncio.create_task(cache.aget("nmc", "厦门", afetch))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(cache.aget("nmc", "厦门", afetch)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return results
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [["晴"]] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["coalesced"], 3)
+
+    def test_fetch_task_cancelled(self):
+        """上游请求任务本身被取消时，等待者收到异常而不是一直挂起"""
+        cache = WeatherCache()
+
+        async def afetch():
+            await asyncio.sleep(10)
+
+        async def main():
+            leader = asyncio.create_task(cache.aget("nmc", "厦门", afetch))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(cache.aget("nmc", "厦门", afetch))
+            await asyncio.sleep(0.01)
+            for task in list(cache._tasks):
+                task.cancel()
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(waiter, timeout=1)
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            self.assertEqual(cache._ainflight, {})
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
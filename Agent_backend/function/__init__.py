@@ -1,9 +1,9 @@
 from bs4 import BeautifulSoup
-import requests
 import bs4
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import re
 from langchain_community.document_loaders import WebBaseLoader
+from app.services import http_client
 
 
 
@@ -31,9 +31,28 @@ def load_and_split(url):
 def fetch_weather_data(url):
     try:
         print(f"获取天气数据URL: {url}")
-        response = requests.get(url, timeout=10)
-        
-        if not response.ok:
+        response = http_client.get(url)
+        return _parse_weather_response(response)
+    except Exception as e:
+        print(f"提取天气数据失败: {e}")
+        return []
+
+
+#异步版本，使用共享连接池，不阻塞事件循环
+async def afetch_weather_data(url):
+    try:
+        print(f"获取天气数据URL: {url}")
+        response = await http_client.aget(url)
+        return _parse_weather_response(response)
+    except Exception as e:
+        print(f"提取天气数据失败: {e}")
+        return []
+
+
+#解析天气页面响应
+def _parse_weather_response(response):
+    try:
+        if not response.is_success:
             print(f"获取天气页面失败: 状态码 {response.status_code}")
             return []
             
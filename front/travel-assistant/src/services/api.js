@@ -30,13 +30,8 @@ export async function sendChatMessage(message, sessionId, language = null) {
 // 获取城市景点信息
 export async function getHotSpot(location) {
   try {
-    const response = await fetch('/api/hotspot', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ location }),
-    })
+    // 使用GET请求，浏览器可按ETag缓存景点列表
+    const response = await fetch(`/api/hotspot?${new URLSearchParams({ location })}`)
     
     if (!response.ok) {
       throw new Error(`获取景点信息失败: ${response.status}`)
@@ -210,13 +205,7 @@ export async function getWeatherByCityName(city) {
 export async function getCityAttractions(city) {
   try {
     console.log(`正在获取${city}的景点数据...`);
-    const response = await fetch('/api/hotspot', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({ location: city })
-    });
+    const response = await fetch(`/api/hotspot?${new URLSearchParams({ location: city })}`);
 
     if (!response.ok) {
       throw new Error(`获取景点数据失败: ${response.status}`);